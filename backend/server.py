@@ -1,16 +1,24 @@
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, Query
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
 from enum import Enum
 import os
 import uuid
 import bcrypt
 import re
 import json
+import base64
+import hashlib
+import math
+import struct
+import mimetypes
+import stat
+import time
+from collections import OrderedDict
 # Mock auth for testing
 class MockAuth:
     def get_token(self):
@@ -21,11 +29,19 @@ class MockAuth:
 
 emergent_auth = MockAuth()
 import shutil
-import subprocess
 import urllib.parse
+import aiofiles
+import tempfile
+import io
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from multipart.multipart import MultipartParser, parse_options_header
 
 # MongoDB connection
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import asyncio
 
 # Initialize FastAPI
@@ -98,6 +114,15 @@ class Video(BaseModel):
     video_type: VideoType = VideoType.LOCAL
     video_url: Optional[str] = None  # For local videos
     youtube_video_id: Optional[str] = None  # For YouTube videos
+    file_size: Optional[int] = None  # Bytes, for uploaded videos
+    sha256: Optional[str] = None  # Hex digest of the uploaded file
+    processing_status: Optional[str] = None  # processing / ready / failed for uploaded videos
+    media_info: Optional[dict] = None  # duration_ms, width, height, codecs, bit_rate from the probe
+    hls_manifest_url: Optional[str] = None  # Master playlist of the adaptive-bitrate ladder
+    thumbnails: Optional[List[dict]] = None  # width, height, webp_url, jpg_url per size for srcset
+    preview_sprite: Optional[dict] = None  # vtt_url and tile layout of the scrubbing sprite
+    
+    comment_count: int = 0  # Maintained by comment create/delete
     
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -179,6 +204,20 @@ class UserList(BaseModel):
 class VideoListRequest(BaseModel):
     video_id: str
 
+class ResumableUploadRequest(BaseModel):
+    filename: str
+    content_type: str
+    total_size: int = Field(gt=0)
+    title: str
+    description: str
+    level: VideoLevel
+    accents: List[str] = []
+    tags: List[str] = []
+    instructor_name: str
+    country: CountryType
+    topics: List[str] = []
+    is_premium: bool = False
+
 class ManualActivityRequest(BaseModel):
     date: str
     minutes: int
@@ -210,7 +249,11 @@ class Comment(BaseModel):
     text: str
     pinned: bool = False  # New field for pinned comments
     parent_comment_id: Optional[str] = None  # For threaded replies
+    root_id: Optional[str] = None  # Top-level comment of the thread (itself for top-level comments)
+    path: Optional[str] = None  # Materialized path; sorting by it gives thread display order
+    depth: int = 0  # 0 for top-level comments
     like_count: int = 0  # Number of likes
+    reply_count: int = 0  # Number of replies anywhere below this comment
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class CommentRequest(BaseModel):
@@ -284,12 +327,204 @@ def require_role(required_role: UserRole):
 UPLOAD_DIR = "/app/backend/uploads"
 VIDEO_DIR = os.path.join(UPLOAD_DIR, "videos")
 THUMBNAIL_DIR = os.path.join(UPLOAD_DIR, "thumbnails")
+HLS_DIR = os.path.join(UPLOAD_DIR, "hls")
+# Partial uploads live on the same filesystem so finished files can be renamed into place atomically
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, "tmp")
 
 os.makedirs(VIDEO_DIR, exist_ok=True)
 os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+os.makedirs(HLS_DIR, exist_ok=True)
+
+# The platform default for .ts is often a translation file type
+mimetypes.add_type("video/mp2t", ".ts")
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
 
-# Mount static files for serving uploaded content
-app.mount("/files", StaticFiles(directory=UPLOAD_DIR), name="files")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_VIDEO_UPLOAD_BYTES = int(os.environ.get("MAX_VIDEO_UPLOAD_BYTES", 4 * 1024 * 1024 * 1024))
+# Room for the other form fields and multipart boundaries around the file
+UPLOAD_FORM_OVERHEAD_BYTES = 1024 * 1024
+
+class UploadSizeLimitMiddleware:
+    """Reject upload bodies with 413 as soon as they grow past the limit, before they are written to disk"""
+    
+    def __init__(self, app, paths: List[str], max_bytes: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await JSONResponse(status_code=413, content={"detail": "File too large"})(scope, receive, send)
+            return
+        
+        # Chunked bodies have no Content-Length, so count bytes as they arrive
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="File too large")
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=["/api/admin/videos/upload"],
+    max_bytes=MAX_VIDEO_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+)
+
+# Only these top-level directories of UPLOAD_DIR are public; tmp/ and resumable/ hold partial uploads
+MEDIA_SERVE_DIRS = {"videos", "thumbnails", "hls"}
+# Blob files are named by their sha256 and every HLS packaging run writes a fresh
+# directory, so the bytes behind these paths never change
+IMMUTABLE_MEDIA_PATH = re.compile(r"^(videos/[0-9a-f]{64}(\.faststart)?\.[A-Za-z0-9]+|hls/.+)$")
+# e.g. "/protected-media/" to let an nginx internal location serve the file instead
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX")
+
+def get_media_cache_control(file_path: str) -> str:
+    if IMMUTABLE_MEDIA_PATH.match(file_path):
+        return "public, max-age=31536000, immutable"
+    # Other files can be regenerated in place, so clients revalidate with the ETag
+    return "public, no-cache"
+
+def media_not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def parse_byte_range(range_header: str, size: int) -> Optional[tuple]:
+    """Parse a single "bytes=" range into inclusive (start, end); None means send the whole file"""
+    unit, _, spec = range_header.partition("=")
+    # Multi-range requests get the whole file, which RFC 9110 allows
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    
+    match = re.fullmatch(r"(\d*)-(\d*)", spec.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    
+    if not first:
+        # Suffix range: the final <last> bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    
+    start = int(first)
+    # last < first is syntactically invalid, and RFC 9110 says to ignore such a Range
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, min(int(last), size - 1) if last else size - 1
+
+class MediaFileResponse(Response):
+    """Send a whole file or one byte range, using the server's zero-copy send when it offers one"""
+    chunk_size = UPLOAD_CHUNK_SIZE
+    
+    def __init__(self, path: str, size: int, byte_range: Optional[tuple], headers: dict, media_type: str):
+        start, end = byte_range or (0, size - 1)
+        self.path = path
+        self.offset = start
+        self.count = end - start + 1
+        super().__init__(status_code=206 if byte_range else 200, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(self.count)
+        if byte_range:
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+    
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        
+        with open(self.path, "rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                # The server passes the descriptor to sendfile(2); no bytes go through Python
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False
+                })
+                return
+            
+            position, end = self.offset, self.offset + self.count
+            while position < end:
+                chunk = await asyncio.to_thread(os.pread, file.fileno(), min(self.chunk_size, end - position), position)
+                if not chunk:
+                    raise RuntimeError(f"{self.path} shrank while it was being sent")
+                position += len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": position < end})
+
+@app.api_route("/files/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_media_file(file_path: str, request: Request):
+    """Serve uploaded media with validators, byte ranges and long-lived caching for content-addressed names"""
+    media_root = os.path.realpath(UPLOAD_DIR)
+    full_path = os.path.realpath(os.path.join(media_root, file_path))
+    top_dir = os.path.relpath(full_path, media_root).split(os.sep)[0]
+    if top_dir not in MEDIA_SERVE_DIRS or full_path == os.path.join(media_root, top_dir):
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        stat_result = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    cache_control = get_media_cache_control(file_path)
+    if MEDIA_ACCEL_REDIRECT_PREFIX:
+        # The proxy does ranges, validators and sendfile itself
+        return Response(media_type=media_type, headers={
+            "X-Accel-Redirect": MEDIA_ACCEL_REDIRECT_PREFIX + urllib.parse.quote(file_path),
+            "Cache-Control": cache_control
+        })
+    
+    etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": cache_control
+    }
+    if media_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A stale If-Range validator means the client's partial copy is outdated, so it gets the whole file
+    if range_header and (if_range is None or if_range in (etag, last_modified)):
+        try:
+            byte_range = parse_byte_range(range_header, stat_result.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes */{stat_result.st_size}"})
+    
+    return MediaFileResponse(full_path, stat_result.st_size, byte_range, headers, media_type)
 
 # =========== UTILITY FUNCTIONS ===========
 
@@ -307,43 +542,714 @@ def extract_youtube_video_id(url: str) -> Optional[str]:
     
     return None
 
-def get_video_duration(video_path: str) -> int:
-    """Get video duration in minutes using ffmpeg"""
+UPLOAD_FORM_FIELD_MAX_BYTES = 64 * 1024
+
+async def save_multipart_upload(request: Request, file_field: str, max_bytes: int) -> tuple:
+    """Parse a multipart body as it arrives, writing the file part straight to a temp file in
+    UPLOAD_TMP_DIR and hashing it on the way; returns (fields, saved_file)"""
+    # Starlette's form parser spools file parts to the system temp dir (often tmpfs), which then
+    # had to be copied here; parsing the stream ourselves writes the upload to disk once
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    
+    # The parser callbacks are synchronous, so they queue events that are handled between reads
+    events = []
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": lambda data, start, end: events.append(("header_field", data[start:end])),
+        "on_header_value": lambda data, start, end: events.append(("header_value", data[start:end])),
+        "on_header_end": lambda: events.append(("header_end", b"")),
+        "on_headers_finished": lambda: events.append(("headers_finished", b"")),
+        "on_part_data": lambda data, start, end: events.append(("part_data", data[start:end])),
+        "on_part_end": lambda: events.append(("part_end", b""))
+    })
+    
+    fields = {}
+    saved_file = None
+    temp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4()}.part")
+    sha256 = hashlib.sha256()
+    buffer = None
+    header_field, header_value, headers = b"", b"", {}
+    part_name, part_data = None, None
+    
     try:
-        result = subprocess.run([
-            'ffmpeg', '-i', video_path, '-f', 'null', '-'
-        ], capture_output=True, text=True, stderr=subprocess.STDOUT)
-        
-        # Parse duration from ffmpeg output
-        duration_line = None
-        for line in result.stdout.split('\n'):
-            if 'Duration:' in line:
-                duration_line = line
-                break
-        
-        if duration_line:
-            # Extract duration (format: HH:MM:SS.ms)
-            duration_str = duration_line.split('Duration: ')[1].split(',')[0]
-            hours, minutes, seconds = duration_str.split(':')
-            total_minutes = int(hours) * 60 + int(minutes) + (float(seconds) / 60)
-            return max(1, int(total_minutes))  # At least 1 minute
-        
-    except Exception as e:
-        print(f"Error getting video duration: {e}")
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event, data in events:
+                if event == "header_field":
+                    header_field += data
+                elif event == "header_value":
+                    header_value += data
+                elif event == "header_end":
+                    headers[header_field.lower()] = header_value
+                    header_field, header_value = b"", b""
+                elif event == "headers_finished":
+                    _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+                    part_name = disposition.get(b"name", b"").decode("latin-1")
+                    if part_name == file_field and b"filename" in disposition:
+                        if saved_file:
+                            raise HTTPException(status_code=400, detail=f"Only one {file_field} may be sent")
+                        saved_file = {
+                            "path": temp_path,
+                            "size": 0,
+                            "filename": disposition[b"filename"].decode("utf-8", "replace"),
+                            "content_type": headers.get(b"content-type", b"").decode("latin-1")
+                        }
+                        buffer = await aiofiles.open(temp_path, "wb")
+                    else:
+                        part_data = b""
+                elif event == "part_data":
+                    if buffer:
+                        saved_file["size"] += len(data)
+                        if saved_file["size"] > max_bytes:
+                            raise HTTPException(status_code=413, detail="File too large")
+                        sha256.update(data)
+                        await buffer.write(data)
+                    elif part_data is not None:
+                        part_data += data
+                        if len(part_data) > UPLOAD_FORM_FIELD_MAX_BYTES:
+                            raise HTTPException(status_code=413, detail=f"Form field {part_name} is too large")
+                elif event == "part_end":
+                    if buffer:
+                        await buffer.close()
+                        buffer = None
+                    elif part_data is not None:
+                        fields[part_name] = part_data.decode("utf-8", "replace")
+                    headers, part_name, part_data = {}, None, None
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        if buffer:
+            await buffer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    
+    if buffer:
+        # The body ended inside the file part
+        await buffer.close()
+        os.remove(temp_path)
+        raise HTTPException(status_code=400, detail="Incomplete multipart body")
+    if saved_file:
+        saved_file["sha256"] = sha256.hexdigest()
+    return fields, saved_file
+
+MEDIA_COMMAND_TIMEOUT_SECONDS = int(os.environ.get("MEDIA_COMMAND_TIMEOUT_SECONDS", 3600))
+
+async def run_media_command(args: List[str], timeout: int = MEDIA_COMMAND_TIMEOUT_SECONDS) -> tuple:
+    """Run ffmpeg/ffprobe as an asyncio subprocess; returns (returncode, stdout, stderr)"""
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        # Timeouts and cancellation must not leave ffmpeg running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    return process.returncode, stdout, stderr
+
+async def extract_video_frame(video_path: str, output_path: str, at_seconds: float):
+    """Write a single full-resolution frame at at_seconds using ffmpeg"""
+    # -ss before -i seeks on keyframes instead of decoding up to the timestamp
+    returncode, _, stderr = await run_media_command([
+        'ffmpeg', '-ss', f"{at_seconds:.3f}", '-i', video_path, '-frames:v', '1', '-q:v', '2',
+        '-y', output_path
+    ])
+    if returncode != 0 or not os.path.exists(output_path):
+        raise RuntimeError(f"ffmpeg could not extract a frame: {stderr.decode(errors='replace')[-300:]}")
+
+# =========== MEDIA PROBE ===========
+
+# Only the moov atom is read, never the media data, so anything larger is not a sane header
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+MP4_CODEC_NAMES = {
+    "avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc", "av01": "av1",
+    "vp09": "vp9", "mp4a": "aac", "ac-3": "ac3", "ec-3": "eac3", "Opus": "opus"
+}
+
+def iter_mp4_atoms(data: bytes, start: int, end: int):
+    """Yield (type, payload_start, payload_end) for the atoms between start and end"""
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[offset:offset + 8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield kind, offset + header_size, min(offset + size, end)
+        offset += size
+
+# Atoms that may open an MP4/MOV file; anything else is not worth scanning
+MP4_LEADING_ATOMS = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"}
+
+def iter_mp4_file_atoms(source, file_size: int):
+    """Yield (type, offset, header_size, size) for the top-level atoms of an open file, reading only their headers"""
+    offset = 0
+    while offset + 8 <= file_size:
+        source.seek(offset)
+        header = source.read(16)
+        size, kind = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            return
+        yield kind, offset, header_size, size
+        offset += size
+
+def read_mp4_moov(path: str) -> Optional[bytes]:
+    """Find the top-level moov atom by hopping over atom headers and return its payload"""
+    with open(path, "rb") as source:
+        for kind, offset, header_size, size in iter_mp4_file_atoms(source, os.fstat(source.fileno()).st_size):
+            if kind == b"moov":
+                if size > MAX_MOOV_BYTES:
+                    return None
+                source.seek(offset + header_size)
+                return source.read(size - header_size)
+    return None
+
+def get_mp4_moov_placement(path: str) -> Optional[str]:
+    """Whether an MP4/MOV file's moov atom comes "before" or "after" its media data; None for other files"""
+    with open(path, "rb") as source:
+        for index, (kind, *_) in enumerate(iter_mp4_file_atoms(source, os.fstat(source.fileno()).st_size)):
+            if index == 0 and kind not in MP4_LEADING_ATOMS:
+                return None
+            if kind == b"moov":
+                return "before"
+            if kind == b"mdat":
+                return "after"
+    return None
+
+def parse_mp4_track(moov: bytes, start: int, end: int) -> dict:
+    """Handler type, codec and display size of one trak atom"""
+    track = {}
+    for kind, payload_start, payload_end in iter_mp4_atoms(moov, start, end):
+        if kind == b"tkhd":
+            # Width and height are 16.16 fixed point at the very end of tkhd
+            width, height = struct.unpack(">II", moov[payload_end - 8:payload_end])
+            track["width"], track["height"] = width >> 16, height >> 16
+        elif kind == b"mdia":
+            for child, child_start, child_end in iter_mp4_atoms(moov, payload_start, payload_end):
+                if child == b"hdlr":
+                    track["handler"] = moov[child_start + 8:child_start + 12].decode("latin-1")
+                elif child == b"minf":
+                    for stbl, stbl_start, stbl_end in iter_mp4_atoms(moov, child_start, child_end):
+                        if stbl != b"stbl":
+                            continue
+                        for stsd, stsd_start, _ in iter_mp4_atoms(moov, stbl_start, stbl_end):
+                            if stsd == b"stsd":
+                                # version/flags, entry count, then the first sample entry's size and format
+                                fourcc = moov[stsd_start + 12:stsd_start + 16].decode("latin-1")
+                                track["codec"] = MP4_CODEC_NAMES.get(fourcc, fourcc)
+    return track
+
+def probe_mp4_metadata(path: str) -> Optional[dict]:
+    """Read duration, resolution and codecs from an MP4/MOV moov atom without touching media data"""
+    moov = read_mp4_moov(path)
+    if not moov:
+        return None
+    
+    media_info = {"duration_ms": None, "width": None, "height": None, "video_codec": None, "audio_codec": None}
+    for kind, start, end in iter_mp4_atoms(moov, 0, len(moov)):
+        if kind == b"mvhd":
+            if moov[start] == 1:
+                timescale, duration = struct.unpack(">IQ", moov[start + 20:start + 32])
+            else:
+                timescale, duration = struct.unpack(">II", moov[start + 12:start + 20])
+            if timescale:
+                media_info["duration_ms"] = duration * 1000 // timescale
+        elif kind == b"trak":
+            track = parse_mp4_track(moov, start, end)
+            if track.get("handler") == "vide" and not media_info["video_codec"]:
+                media_info.update(video_codec=track.get("codec"), width=track.get("width"), height=track.get("height"))
+            elif track.get("handler") == "soun" and not media_info["audio_codec"]:
+                media_info["audio_codec"] = track.get("codec")
+    
+    if not media_info["duration_ms"]:
+        return None
+    file_size = os.path.getsize(path)
+    media_info["bit_rate"] = file_size * 8 * 1000 // media_info["duration_ms"]
+    media_info["format"] = "mp4"
+    return media_info
+
+async def probe_with_ffprobe(path: str) -> Optional[dict]:
+    """Read container and stream metadata with ffprobe, which never decodes frames"""
+    returncode, stdout, _ = await run_media_command([
+        "ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path
+    ], timeout=60)
+    if returncode != 0:
+        return None
     
-    return 5  # Default fallback
+    probe = json.loads(stdout)
+    container = probe.get("format", {})
+    streams = probe.get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), {})
+    if not container.get("duration"):
+        return None
+    
+    return {
+        "duration_ms": int(float(container["duration"]) * 1000),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "bit_rate": int(container["bit_rate"]) if container.get("bit_rate") else None,
+        "format": container.get("format_name")
+    }
 
-def generate_thumbnail(video_path: str, thumbnail_path: str) -> bool:
-    """Generate thumbnail from video using ffmpeg"""
+async def probe_media(path: str) -> dict:
+    """Probe a media file with ffprobe, falling back to the built-in MP4 parser"""
+    media_info = None
     try:
-        subprocess.run([
-            'ffmpeg', '-i', video_path, '-ss', '00:00:05', '-vframes', '1', 
-            '-y', thumbnail_path
-        ], check=True, capture_output=True)
-        return True
-    except Exception as e:
-        print(f"Error generating thumbnail: {e}")
-        return False
+        media_info = await probe_with_ffprobe(path)
+        probed_with = "ffprobe"
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error running ffprobe on {path}: {e}")
+    
+    if not media_info:
+        try:
+            media_info = await asyncio.to_thread(probe_mp4_metadata, path)
+        except (struct.error, IndexError) as e:
+            print(f"Error parsing MP4 metadata of {path}: {e}")
+        probed_with = "mp4"
+    if not media_info:
+        raise RuntimeError(f"Could not read media metadata from {path}")
+    
+    media_info["probed_with"] = probed_with
+    return media_info
+
+def get_duration_minutes(media_info: dict) -> int:
+    return max(1, round(media_info["duration_ms"] / 60000))  # At least 1 minute
+
+# =========== DAILY ACTIVITY ROLLUPS ===========
+
+# Days of rollups read by the progress endpoint
+DAILY_ACTIVITY_WINDOW_DAYS = 365
+ROLLUP_BACKFILL_BATCH_SIZE = 1000
+
+def get_learner_id(session_id: str, current_user: Optional[User]) -> str:
+    """Key activity by user when authenticated, otherwise by anonymous session"""
+    return current_user.id if current_user else session_id
+
+def get_learner_ids(session_id: str, current_user: Optional[User]) -> List[str]:
+    """All learner keys whose activity belongs to the current viewer"""
+    if current_user:
+        return [current_user.id, session_id]
+    return [session_id]
+
+def parse_activity_date(date_str: str) -> str:
+    """Validate a YYYY-MM-DD activity date that is not after today (UTC) and return it normalized"""
+    try:
+        date = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Date must be in YYYY-MM-DD format")
+    # A future day would become the streak's last active date and keep it alive indefinitely
+    if date > datetime.utcnow().date():
+        raise HTTPException(status_code=400, detail="Date cannot be in the future")
+    return date.isoformat()
+
+async def record_daily_activity(
+    learner_id: str,
+    date: str,
+    minutes: int = 0,
+    manual_minutes: int = 0,
+    video_id: Optional[str] = None
+):
+    """Apply an activity delta to the learner's rollup for a single day"""
+    update = {
+        "$inc": {"minutes": minutes, "manual_minutes": manual_minutes},
+        "$set": {"updated_at": datetime.utcnow()}
+    }
+    if video_id:
+        update["$addToSet"] = {"video_ids": video_id}
+    
+    previous = await db.daily_activity.find_one_and_update(
+        {"learner_id": learner_id, "date": date},
+        update,
+        projection={"_id": 0, "minutes": 1, "manual_minutes": 1, "video_ids": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    
+    video_ids = previous.get("video_ids", []) if previous else []
+    if previous and not minutes and not manual_minutes and (not video_id or video_id in video_ids):
+        # A heartbeat that credited nothing new cannot move the streak or the goal
+        return
+    
+    rollup = {
+        "minutes": (previous or {}).get("minutes", 0) + minutes,
+        "manual_minutes": (previous or {}).get("manual_minutes", 0) + manual_minutes,
+        "video_ids": video_ids + [video_id] if video_id and video_id not in video_ids else video_ids
+    }
+    await update_learner_streaks(learner_id, date, rollup)
+
+async def save_watch_progress(progress_data: dict) -> int:
+    """Upsert a progress record and return the minutes past the furthest point already credited"""
+    query = {"session_id": progress_data["session_id"], "video_id": progress_data["video_id"]}
+    watched_date = progress_data["last_watched_at"].date().isoformat()
+    credited_day = f"credited_days.{watched_date}"
+    previous = await db.user_progress.find_one_and_update(
+        query,
+        {"$set": progress_data, "$max": {"credited_minutes": progress_data["minutes_watched"]}},
+        projection={"_id": 0, "minutes_watched": 1, "credited_minutes": 1, credited_day: 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    ) or {}
+    
+    # Rewatching or seeking backwards reports an earlier position, which credits nothing
+    credited_minutes = previous.get("credited_minutes", previous.get("minutes_watched", 0))
+    minutes_delta = max(0, progress_data["minutes_watched"] - credited_minutes)
+    
+    # Per-day credits let unmarking take the minutes back from the days they were added to
+    update = {}
+    if minutes_delta or watched_date not in previous.get("credited_days", {}):
+        update["$inc"] = {credited_day: minutes_delta}
+    if "credited_minutes" not in previous and credited_minutes > progress_data["minutes_watched"]:
+        # Records from before credited_minutes existed were credited up to minutes_watched
+        update["$max"] = {"credited_minutes": credited_minutes}
+    # Most heartbeats replay already credited minutes and need no second write
+    if update:
+        await db.user_progress.update_one(query, update)
+    
+    return minutes_delta
+
+async def get_daily_activity(learner_ids: List[str], days: int = DAILY_ACTIVITY_WINDOW_DAYS) -> dict:
+    """Load recent rollups for the given learner keys, merged per date"""
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    rollups = await db.daily_activity.find(
+        {"learner_id": {"$in": learner_ids}, "date": {"$gte": since}},
+        {"_id": 0, "date": 1, "minutes": 1, "manual_minutes": 1, "video_ids": 1}
+    ).to_list(days * len(learner_ids))
+    
+    activity = {}
+    for rollup in rollups:
+        day = activity.setdefault(rollup["date"], {"minutes": 0, "manual_minutes": 0, "video_ids": set()})
+        day["minutes"] += rollup.get("minutes", 0)
+        day["manual_minutes"] += rollup.get("manual_minutes", 0)
+        day["video_ids"].update(rollup.get("video_ids", []))
+    
+    return {
+        date: {"minutes": day["minutes"], "manual_minutes": day["manual_minutes"], "videos_count": len(day["video_ids"])}
+        for date, day in activity.items()
+    }
+
+async def aggregate_progress_stats(query: dict) -> dict:
+    """Compute progress totals inside MongoDB in one round trip"""
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": "$video_id",
+            # Rewatching moves minutes_watched backwards, the credited minutes do not
+            "minutes": {"$sum": {"$ifNull": ["$credited_minutes", "$minutes_watched"]}},
+            "completed": {"$max": "$completed"}
+        }},
+        {"$group": {
+            "_id": None,
+            "total_minutes": {"$sum": "$minutes"},
+            "unique_videos": {"$sum": 1},
+            "completed_videos": {"$sum": {"$cond": ["$completed", 1, 0]}}
+        }}
+    ]
+    
+    result = await db.user_progress.aggregate(pipeline).to_list(1)
+    totals = result[0] if result else {}
+    
+    return {
+        "total_minutes": totals.get("total_minutes", 0),
+        "unique_videos": totals.get("unique_videos", 0),
+        "completed_videos": totals.get("completed_videos", 0)
+    }
+
+async def backfill_daily_activity() -> int:
+    """Rebuild daily_activity rollups from raw progress and manual activity records"""
+    progress_days = db.user_progress.aggregate([
+        {"$match": {"last_watched_at": {"$type": "date"}}},
+        # Per-day credits where they were recorded, otherwise everything on the last day watched
+        {"$project": {
+            "learner_id": {"$ifNull": ["$user_id", "$session_id"]},
+            "video_id": 1,
+            "credits": {"$ifNull": [
+                {"$objectToArray": "$credited_days"},
+                [{
+                    "k": {"$dateToString": {"format": "%Y-%m-%d", "date": "$last_watched_at"}},
+                    "v": "$minutes_watched"
+                }]
+            ]}
+        }},
+        {"$unwind": "$credits"},
+        {"$group": {
+            "_id": {"learner_id": "$learner_id", "date": "$credits.k"},
+            "minutes": {"$sum": "$credits.v"},
+            "video_ids": {"$addToSet": "$video_id"}
+        }}
+    ], allowDiskUse=True)
+    
+    manual_days = db.manual_activities.aggregate([
+        {"$group": {
+            "_id": {"learner_id": "$user_id", "date": "$date"},
+            "manual_minutes": {"$sum": "$minutes"}
+        }}
+    ], allowDiskUse=True)
+    
+    updated = 0
+    for cursor, fields in ((progress_days, ("minutes", "video_ids")), (manual_days, ("manual_minutes",))):
+        operations = []
+        async for group in cursor:
+            operations.append(UpdateOne(
+                group["_id"],
+                {"$set": {**{field: group[field] for field in fields}, "updated_at": datetime.utcnow()}},
+                upsert=True
+            ))
+            if len(operations) >= ROLLUP_BACKFILL_BATCH_SIZE:
+                await db.daily_activity.bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+        if operations:
+            await db.daily_activity.bulk_write(operations, ordered=False)
+            updated += len(operations)
+    
+    return updated
+
+# =========== STREAK ENGINE ===========
+
+DEFAULT_DAILY_MINUTES_GOAL = 30
+
+def is_active_day(rollup: dict) -> bool:
+    """A day counts towards the streak once it has any logged activity"""
+    return bool(rollup.get("video_ids")) or get_day_minutes(rollup) > 0
+
+def get_day_minutes(rollup: dict) -> int:
+    """Platform plus manual minutes recorded in a daily rollup"""
+    return rollup.get("minutes", 0) + rollup.get("manual_minutes", 0)
+
+def days_between(from_date: str, to_date: str) -> int:
+    """Number of days from one YYYY-MM-DD date to another"""
+    return (datetime.strptime(to_date, "%Y-%m-%d") - datetime.strptime(from_date, "%Y-%m-%d")).days
+
+def next_streak_count(current: int, last_date: Optional[str], date: str) -> int:
+    """Extend a streak with a day later than its last day, or start a new one"""
+    if last_date and days_between(last_date, date) == 1:
+        return current + 1
+    return 1
+
+def get_effective_streak(count: int, last_date: Optional[str]) -> int:
+    """A stored streak stays alive until a full day passes without activity"""
+    if not last_date:
+        return 0
+    return count if days_between(last_date, datetime.utcnow().date().isoformat()) <= 1 else 0
+
+async def get_learner_daily_goal(learner_id: str) -> int:
+    """Daily minutes goal for a learner (sessions fall back to the default)"""
+    settings = await db.user_settings.find_one({"user_id": learner_id}, {"_id": 0, "daily_minutes_goal": 1})
+    return settings.get("daily_minutes_goal", DEFAULT_DAILY_MINUTES_GOAL) if settings else DEFAULT_DAILY_MINUTES_GOAL
+
+async def update_learner_streaks(learner_id: str, date: str, rollup: dict):
+    """Advance the stored streak state for a write to the given day in O(1)"""
+    state = await db.learner_streaks.find_one({"learner_id": learner_id}, {"_id": 0}) or {}
+    
+    # Backdated activity can join or split earlier streaks, so rebuild from the rollups
+    last_active_date = state.get("last_active_date")
+    if last_active_date and date < last_active_date:
+        await recalculate_learner_streaks(learner_id)
+        return
+    
+    updates = {}
+    
+    # Keep today's total on the state document so goal status is a single read
+    if date == datetime.utcnow().date().isoformat():
+        updates.update({"today_date": date, "today_minutes": get_day_minutes(rollup)})
+    
+    if is_active_day(rollup) and date != last_active_date:
+        current_streak = next_streak_count(state.get("current_streak", 0), last_active_date, date)
+        updates.update({
+            "current_streak": current_streak,
+            "longest_streak": max(state.get("longest_streak", 0), current_streak),
+            "last_active_date": date
+        })
+    
+    daily_goal = state.get("daily_minutes_goal")
+    if daily_goal is None:
+        daily_goal = await get_learner_daily_goal(learner_id)
+        updates["daily_minutes_goal"] = daily_goal
+    
+    last_goal_date = state.get("last_goal_date")
+    if date != last_goal_date and get_day_minutes(rollup) >= daily_goal:
+        goal_streak = next_streak_count(state.get("goal_streak", 0), last_goal_date, date)
+        updates.update({
+            "goal_streak": goal_streak,
+            "longest_goal_streak": max(state.get("longest_goal_streak", 0), goal_streak),
+            "last_goal_date": date
+        })
+    
+    if updates:
+        updates["updated_at"] = datetime.utcnow()
+        await db.learner_streaks.update_one(
+            {"learner_id": learner_id},
+            {"$set": updates},
+            upsert=True
+        )
+
+async def recalculate_learner_streaks(learner_id: str):
+    """Rebuild a learner's streak state with a single pass over their daily rollups"""
+    daily_goal = await get_learner_daily_goal(learner_id)
+    
+    today = datetime.utcnow().date().isoformat()
+    state = {
+        "current_streak": 0,
+        "longest_streak": 0,
+        "last_active_date": None,
+        "goal_streak": 0,
+        "longest_goal_streak": 0,
+        "last_goal_date": None,
+        "daily_minutes_goal": daily_goal,
+        "today_date": today,
+        "today_minutes": 0
+    }
+    
+    rollups = db.daily_activity.find(
+        {"learner_id": learner_id},
+        {"_id": 0, "date": 1, "minutes": 1, "manual_minutes": 1, "video_ids": 1}
+    ).sort("date", 1)
+    
+    async for rollup in rollups:
+        date = rollup["date"]
+        if date == today:
+            state["today_minutes"] = get_day_minutes(rollup)
+        if is_active_day(rollup):
+            state["current_streak"] = next_streak_count(state["current_streak"], state["last_active_date"], date)
+            state["longest_streak"] = max(state["longest_streak"], state["current_streak"])
+            state["last_active_date"] = date
+        if get_day_minutes(rollup) >= daily_goal:
+            state["goal_streak"] = next_streak_count(state["goal_streak"], state["last_goal_date"], date)
+            state["longest_goal_streak"] = max(state["longest_goal_streak"], state["goal_streak"])
+            state["last_goal_date"] = date
+    
+    state["updated_at"] = datetime.utcnow()
+    await db.learner_streaks.update_one(
+        {"learner_id": learner_id},
+        {"$set": state},
+        upsert=True
+    )
+
+# =========== LEVEL HOURS ACCOUNTING ===========
+
+# Cumulative hours of input at which each level starts
+# Master is a learner milestone only, no video is tagged with it
+LEVEL_HOUR_THRESHOLDS = [
+    (VideoLevel.NEW_BEGINNER.value, 0),
+    (VideoLevel.BEGINNER.value, 25),
+    (VideoLevel.INTERMEDIATE.value, 75),
+    (VideoLevel.ADVANCED.value, 200),
+    ("Master", 500),
+]
+
+VIDEO_METADATA_TTL_SECONDS = 300
+VIDEO_METADATA_FIELDS = {"_id": 0, "id": 1, "duration_minutes": 1, "level": 1, "accents": 1, "topics": 1}
+video_metadata_cache = {}
+
+async def get_video_metadata(video_id: str) -> Optional[dict]:
+    """Get the fields progress accounting needs for a video, cached in-process"""
+    cached = video_metadata_cache.get(video_id)
+    if cached and cached[0] > datetime.utcnow():
+        return cached[1]
+    
+    metadata = await db.videos.find_one({"id": video_id}, VIDEO_METADATA_FIELDS)
+    if metadata:
+        video_metadata_cache[video_id] = (datetime.utcnow() + timedelta(seconds=VIDEO_METADATA_TTL_SECONDS), metadata)
+    return metadata
+
+def counter_key(value: str) -> str:
+    """Make a level, accent or topic name safe to use as a document field name"""
+    return str(value).replace(".", "_").lstrip("$")
+
+def build_level_minutes_increments(metadata: dict, minutes: int) -> dict:
+    """Build the $inc document crediting minutes to a video's level, accents and topics"""
+    increments = {"video_minutes": minutes}
+    if metadata.get("level"):
+        increments[f"level_minutes.{counter_key(metadata['level'])}"] = minutes
+    for accent in metadata.get("accents", []):
+        increments[f"accent_minutes.{counter_key(accent)}"] = minutes
+    for topic in metadata.get("topics", []):
+        increments[f"topic_minutes.{counter_key(topic)}"] = minutes
+    return increments
+
+async def record_level_minutes(learner_id: str, increments: dict):
+    """Apply minute increments to a learner's level-hours counters"""
+    await db.learner_level_hours.update_one(
+        {"learner_id": learner_id},
+        {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+def get_level_for_hours(total_hours: float) -> dict:
+    """Work out the current level and the hours still needed to reach the next one"""
+    current_level, next_level = LEVEL_HOUR_THRESHOLDS[0], None
+    for index, (level, hours) in enumerate(LEVEL_HOUR_THRESHOLDS):
+        if total_hours >= hours:
+            current_level = (level, hours)
+            next_level = LEVEL_HOUR_THRESHOLDS[index + 1] if index + 1 < len(LEVEL_HOUR_THRESHOLDS) else None
+    
+    return {
+        "current_level": current_level[0],
+        "next_level": next_level[0] if next_level else None,
+        "next_level_hours": next_level[1] if next_level else None,
+        "hours_to_next_level": round(max(0, next_level[1] - total_hours), 1) if next_level else None
+    }
+
+async def backfill_level_hours() -> int:
+    """Rebuild every learner's level-hours counters from raw progress and manual activity"""
+    learner_counters = {}
+    
+    watched = db.user_progress.aggregate([
+        {"$group": {
+            "_id": {"learner_id": {"$ifNull": ["$user_id", "$session_id"]}, "video_id": "$video_id"},
+            "minutes": {"$sum": {"$ifNull": ["$credited_minutes", "$minutes_watched"]}}
+        }},
+        {"$lookup": {
+            "from": "videos",
+            "localField": "_id.video_id",
+            "foreignField": "id",
+            "as": "video"
+        }},
+        {"$project": {"minutes": 1, "video.level": 1, "video.accents": 1, "video.topics": 1}}
+    ], allowDiskUse=True)
+    
+    async for group in watched:
+        counters = learner_counters.setdefault(group["_id"]["learner_id"], {})
+        metadata = group["video"][0] if group["video"] else {}
+        for field, minutes in build_level_minutes_increments(metadata, group["minutes"]).items():
+            counters[field] = counters.get(field, 0) + minutes
+    
+    async for group in db.manual_activities.aggregate([
+        {"$group": {"_id": "$user_id", "minutes": {"$sum": "$minutes"}}}
+    ]):
+        learner_counters.setdefault(group["_id"], {})["manual_minutes"] = group["minutes"]
+    
+    operations = [
+        UpdateOne(
+            {"learner_id": learner_id},
+            {"$set": {**counters, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        for learner_id, counters in learner_counters.items()
+    ]
+    for start in range(0, len(operations), ROLLUP_BACKFILL_BATCH_SIZE):
+        await db.learner_level_hours.bulk_write(operations[start:start + ROLLUP_BACKFILL_BATCH_SIZE], ordered=False)
+    
+    return len(operations)
 
 # =========== VIDEO ENDPOINTS ===========
 
@@ -439,7 +1345,7 @@ async def track_video_watch(
     """Track video watch progress"""
     
     # Verify video exists
-    video = await db.videos.find_one({"id": video_id}, {"_id": 0})
+    video = await get_video_metadata(video_id)
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
     
@@ -453,15 +1359,17 @@ async def track_video_watch(
         "last_watched_at": datetime.utcnow()
     }
     
-    # Update or insert progress
-    await db.user_progress.update_one(
-        {
-            "session_id": session_id,
-            "video_id": video_id
-        },
-        {"$set": progress_data},
-        upsert=True
+    # Update or insert progress, rolling up only newly watched minutes
+    minutes_delta = await save_watch_progress(progress_data)
+    learner_id = get_learner_id(session_id, current_user)
+    await record_daily_activity(
+        learner_id,
+        progress_data["last_watched_at"].date().isoformat(),
+        minutes=minutes_delta,
+        video_id=video_id
     )
+    if minutes_delta:
+        await record_level_minutes(learner_id, build_level_minutes_increments(video, minutes_delta))
     
     return {"message": "Progress tracked successfully", "progress": progress_data}
 
@@ -503,135 +1411,1208 @@ async def get_user_progress(
     else:
         query = {"session_id": session_id}
     
-    # Get all progress records
-    progress_records = await db.user_progress.find(query).to_list(1000)
+    # Totals are aggregated server-side so only a few rows come back
+    stats = await aggregate_progress_stats(query)
     
-    # Calculate statistics
-    total_minutes = sum(record.get("minutes_watched", 0) for record in progress_records)
-    unique_videos = len(set(record["video_id"] for record in progress_records))
-    completed_videos = len([r for r in progress_records if r.get("completed", False)])
+    # Per-day figures come from the daily rollups; POST /api/admin/progress/backfill-rollups
+    # builds them for history recorded before the rollups existed
+    activity = await get_daily_activity(get_learner_ids(session_id, current_user))
     
-    # Calculate streak (simplified)
-    today = datetime.utcnow().date()
-    recent_days = []
-    for i in range(30):  # Check last 30 days
-        day = today - timedelta(days=i)
-        day_records = [r for r in progress_records 
-                      if r.get("last_watched_at", datetime.min).date() == day]
-        if day_records:
-            recent_days.append(day)
-        elif i == 0:  # If no activity today, streak is broken
-            break
-    
-    current_streak = len(recent_days)
+    # Streaks are maintained on write, so reading them is a single lookup
+    streaks = await db.learner_streaks.find_one(
+        {"learner_id": get_learner_id(session_id, current_user)},
+        {"_id": 0}
+    ) or {}
     
     # Get today's progress
-    today_records = [r for r in progress_records 
-                    if r.get("last_watched_at", datetime.min).date() == today]
-    today_minutes = sum(record.get("minutes_watched", 0) for record in today_records)
+    today = datetime.utcnow().date()
+    today_minutes = activity.get(today.isoformat(), {}).get("minutes", 0)
     
     return {
-        "total_minutes_watched": total_minutes,
-        "unique_videos_watched": unique_videos,
-        "completed_videos": completed_videos,
-        "current_streak": current_streak,
+        "total_minutes_watched": stats["total_minutes"],
+        "unique_videos_watched": stats["unique_videos"],
+        "completed_videos": stats["completed_videos"],
+        "current_streak": get_effective_streak(streaks.get("current_streak", 0), streaks.get("last_active_date")),
+        "longest_streak": streaks.get("longest_streak", 0),
+        "goal_streak": get_effective_streak(streaks.get("goal_streak", 0), streaks.get("last_goal_date")),
         "today_minutes": today_minutes,
         "recent_activity": [
             {
-                "date": day.isoformat(),
-                "minutes": sum(r.get("minutes_watched", 0) for r in progress_records 
-                             if r.get("last_watched_at", datetime.min).date() == day),
-                "videos_count": len([r for r in progress_records 
-                                   if r.get("last_watched_at", datetime.min).date() == day])
+                "date": date,
+                "minutes": activity[date]["minutes"],
+                "manual_minutes": activity[date]["manual_minutes"],
+                "videos_count": activity[date]["videos_count"]
             }
-            for day in sorted(set(r.get("last_watched_at", datetime.min).date() 
-                                for r in progress_records if r.get("last_watched_at")), reverse=True)[:10]
+            for date in sorted(activity, reverse=True)[:10]
         ]
     }
 
+@app.get("/api/progress/{session_id}/levels")
+async def get_level_progress(
+    session_id: str,
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    """Get hours of input per level, accent and topic and the distance to the next level"""
+    
+    counters = await db.learner_level_hours.find_one(
+        {"learner_id": get_learner_id(session_id, current_user)},
+        {"_id": 0}
+    ) or {}
+    
+    def to_hours(minutes_by_key: dict) -> dict:
+        return {key: round(minutes / 60, 1) for key, minutes in minutes_by_key.items()}
+    
+    total_minutes = counters.get("video_minutes", 0) + counters.get("manual_minutes", 0)
+    total_hours = total_minutes / 60
+    
+    return {
+        "total_hours": round(total_hours, 1),
+        "video_hours": round(counters.get("video_minutes", 0) / 60, 1),
+        "manual_hours": round(counters.get("manual_minutes", 0) / 60, 1),
+        "level_hours": to_hours(counters.get("level_minutes", {})),
+        "accent_hours": to_hours(counters.get("accent_minutes", {})),
+        "topic_hours": to_hours(counters.get("topic_minutes", {})),
+        **get_level_for_hours(total_hours)
+    }
+
+@app.post("/api/admin/progress/backfill-rollups")
+async def backfill_progress_rollups(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Rebuild daily activity rollups from existing progress data (admin only)"""
+    
+    updated = await backfill_daily_activity()
+    
+    # Streak state is derived from the rollups, so rebuild it as well
+    learner_ids = await db.daily_activity.distinct("learner_id")
+    for learner_id in learner_ids:
+        await recalculate_learner_streaks(learner_id)
+    
+    level_counters_updated = await backfill_level_hours()
+    
+    return {
+        "message": "Daily activity rollups rebuilt",
+        "rollups_updated": updated,
+        "learners_recalculated": len(learner_ids),
+        "level_counters_updated": level_counters_updated
+    }
+
+# =========== MEDIA STORAGE ===========
+
+# Uploaded files are stored once per content hash as VIDEO_DIR/<sha256><ext>.
+# media_blobs counts the videos pointing at each file and keeps the fields derived
+# from it (duration, thumbnails, renditions) so a duplicate upload can reuse them.
+MEDIA_BLOB_STORE_ATTEMPTS = 10
+MEDIA_BLOB_STORE_RETRY_SECONDS = 0.5
+
+async def store_media_blob(saved_file: dict, extension: str) -> tuple:
+    """Move a hashed temp file into content-addressed storage, or reference the stored copy; returns (blob, created)"""
+    sha256 = saved_file["sha256"]
+    for _ in range(MEDIA_BLOB_STORE_ATTEMPTS):
+        blob = await db.media_blobs.find_one_and_update(
+            {"sha256": sha256, "status": "stored"},
+            {"$inc": {"refcount": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob:
+            os.remove(saved_file["path"])
+            return blob, False
+        
+        blob = {
+            "sha256": sha256,
+            "filename": f"{sha256}{extension.lower()}",
+            "size": saved_file["size"],
+            "refcount": 1,
+            "status": "stored",
+            "media": {},
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+        try:
+            await db.media_blobs.insert_one(blob)
+        except DuplicateKeyError:
+            # Another upload of the same content got there first, or its last reference is being deleted
+            await asyncio.sleep(MEDIA_BLOB_STORE_RETRY_SECONDS)
+            continue
+        blob.pop("_id", None)
+        
+        try:
+            os.replace(saved_file["path"], os.path.join(VIDEO_DIR, blob["filename"]))
+        except BaseException:
+            await db.media_blobs.delete_one({"sha256": sha256})
+            raise
+        return blob, True
+    
+    raise RuntimeError(f"Could not store media blob {sha256}")
+
+async def release_media_blob(sha256: str) -> bool:
+    """Drop one reference to a blob, deleting its file and derived media once no video uses it"""
+    blob = await db.media_blobs.find_one_and_update(
+        {"sha256": sha256, "status": "stored"},
+        {"$inc": {"refcount": -1}, "$set": {"updated_at": datetime.utcnow()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not blob or blob["refcount"] > 0:
+        return False
+    
+    # Uploads of the same content wait for the delete instead of reusing a file that is going away
+    claimed = await db.media_blobs.update_one(
+        {"sha256": sha256, "status": "stored", "refcount": {"$lte": 0}},
+        {"$set": {"status": "deleting"}}
+    )
+    if not claimed.modified_count:
+        return False
+    
+    blob_path = os.path.join(VIDEO_DIR, blob["filename"])
+    if os.path.exists(blob_path):
+        os.remove(blob_path)
+    for directory in (THUMBNAIL_DIR, HLS_DIR):
+        shutil.rmtree(os.path.join(directory, sha256), ignore_errors=True)
+    await db.media_blobs.delete_one({"sha256": sha256, "status": "deleting"})
+    return True
+
+def get_media_key(video: dict) -> str:
+    """Directory name for a video's thumbnails and HLS packages, shared by videos with the same blob"""
+    return video.get("blob_id") or video["id"]
+
+def distinct_media_videos(videos: List[dict]) -> List[dict]:
+    """Keep one video per media key so backfills process a shared blob once"""
+    distinct = {}
+    for video in videos:
+        distinct.setdefault(get_media_key(video), video)
+    return list(distinct.values())
+
+async def save_video_media(video_id: str, fields: dict, unset: Optional[List[str]] = None):
+    """Write fields derived from a video's file to it, and to every video sharing the same blob"""
+    video = await db.videos.find_one({"id": video_id}, {"_id": 0, "id": 1, "blob_id": 1})
+    if not video:
+        return
+    
+    update = {"$set": {**fields, "updated_at": datetime.utcnow()}}
+    if unset:
+        update["$unset"] = {field: "" for field in unset}
+    
+    if not video.get("blob_id"):
+        await db.videos.update_one({"id": video_id}, update)
+        video_metadata_cache.pop(video_id, None)
+        return
+    
+    # The blob is written first, so a video created from it meanwhile either copies
+    # these fields or is matched by the update_many below
+    blob_update = {"$set": {f"media.{field}": value for field, value in fields.items()}}
+    if unset:
+        blob_update["$unset"] = {f"media.{field}": "" for field in unset}
+    await db.media_blobs.update_one({"sha256": video["blob_id"]}, blob_update)
+    await db.videos.update_many({"blob_id": video["blob_id"]}, update)
+    
+    sharing = await db.videos.find({"blob_id": video["blob_id"]}, {"_id": 0, "id": 1}).to_list(None)
+    for shared in sharing:
+        video_metadata_cache.pop(shared["id"], None)
+
+# =========== MEDIA JOBS ===========
+
+MEDIA_JOB_CONCURRENCY = int(os.environ.get("MEDIA_JOB_CONCURRENCY", 2))
+MEDIA_JOB_MAX_ATTEMPTS = int(os.environ.get("MEDIA_JOB_MAX_ATTEMPTS", 3))
+# A running job whose lease lapses belonged to a dead worker and is handed to another one
+MEDIA_JOB_LEASE_SECONDS = int(os.environ.get("MEDIA_JOB_LEASE_SECONDS", 120))
+MEDIA_JOB_POLL_SECONDS = 5
+MEDIA_JOB_RETRY_DELAY_SECONDS = 30
+
+# job type -> {"run": handler, "on_failure": handler or None}
+media_job_handlers = {}
+
+def media_job_handler(job_type: str, on_failure=None):
+    """Register the coroutine that runs jobs of job_type, and optionally one called when they finally fail"""
+    def register(handler):
+        media_job_handlers[job_type] = {"run": handler, "on_failure": on_failure}
+        return handler
+    return register
+
+class MediaJobQueue:
+    """Jobs persisted in media_jobs and drained by a fixed pool of worker tasks"""
+    
+    def __init__(self, concurrency: int, max_attempts: int, lease_seconds: int):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.worker_prefix = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.workers = []
+        self.wakeup = asyncio.Event()
+        self.running = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.recovered = 0
+    
+    async def enqueue(self, job_type: str, video_id: Optional[str] = None, payload: Optional[dict] = None) -> dict:
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "video_id": video_id,
+            "payload": payload or {},
+            "status": "queued",
+            "attempts": 0,
+            "error": None,
+            "result": None,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "run_after": now,
+            "created_at": now,
+            "updated_at": now
+        }
+        await db.media_jobs.insert_one(job)
+        job.pop("_id", None)
+        self.wakeup.set()
+        return job
+    
+    async def claim(self, worker_id: str) -> Optional[dict]:
+        """Atomically take the oldest runnable job, including running jobs whose lease expired"""
+        now = datetime.utcnow()
+        claimed = {
+            "status": "running",
+            "worker_id": worker_id,
+            "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+            "updated_at": now
+        }
+        job = await db.media_jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_after": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}}
+            ]},
+            {"$set": claimed, "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+            sort=[("run_after", 1)],
+            return_document=ReturnDocument.BEFORE
+        )
+        if not job:
+            return None
+        if job["status"] == "running":
+            self.recovered += 1
+        return {**job, **claimed, "attempts": job["attempts"] + 1}
+    
+    async def keep_lease(self, job_id: str, worker_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await db.media_jobs.update_one(
+                {"id": job_id, "worker_id": worker_id, "status": "running"},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+            )
+    
+    async def finish(self, job: dict, worker_id: str, changes: dict):
+        # Only the worker still holding the job may record its outcome
+        changes["updated_at"] = datetime.utcnow()
+        await db.media_jobs.update_one({"id": job["id"], "worker_id": worker_id}, {"$set": changes})
+    
+    async def run_job(self, job: dict, worker_id: str):
+        handler = media_job_handlers.get(job["type"])
+        heartbeat = asyncio.create_task(self.keep_lease(job["id"], worker_id))
+        self.running += 1
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job type {job['type']}")
+            result = await handler["run"](job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            if job["attempts"] < self.max_attempts:
+                self.retried += 1
+                delay = MEDIA_JOB_RETRY_DELAY_SECONDS * 2 ** (job["attempts"] - 1)
+                await self.finish(job, worker_id, {
+                    "status": "queued",
+                    "error": error,
+                    "lease_expires_at": None,
+                    "run_after": datetime.utcnow() + timedelta(seconds=delay)
+                })
+            else:
+                self.failed += 1
+                print(f"❌ Media job {job['id']} ({job['type']}) failed: {error}")
+                await self.finish(job, worker_id, {"status": "failed", "error": error, "lease_expires_at": None})
+                if handler and handler["on_failure"]:
+                    await handler["on_failure"](job, error)
+        else:
+            self.completed += 1
+            await self.finish(job, worker_id, {"status": "completed", "result": result, "error": None, "lease_expires_at": None})
+        finally:
+            self.running -= 1
+            heartbeat.cancel()
+    
+    async def work(self, worker_id: str):
+        """Worker loop: run jobs back to back, then sleep until woken or the poll interval passes"""
+        while True:
+            try:
+                job = await self.claim(worker_id)
+                if job:
+                    await self.run_job(job, worker_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error running media job: {e}")
+            
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), MEDIA_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    
+    def start(self):
+        self.workers = [
+            asyncio.create_task(self.work(f"{self.worker_prefix}-{index}"))
+            for index in range(self.concurrency)
+        ]
+    
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        # Hand interrupted jobs straight back instead of waiting for their leases to lapse
+        await db.media_jobs.update_many(
+            {"status": "running", "worker_id": {"$regex": f"^{self.worker_prefix}-"}},
+            {"$set": {"status": "queued", "lease_expires_at": None, "updated_at": datetime.utcnow()}, "$inc": {"attempts": -1}}
+        )
+    
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "running": self.running,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "recovered": self.recovered
+        }
+
+media_job_queue = MediaJobQueue(
+    concurrency=MEDIA_JOB_CONCURRENCY,
+    max_attempts=MEDIA_JOB_MAX_ATTEMPTS,
+    lease_seconds=MEDIA_JOB_LEASE_SECONDS
+)
+
+def get_local_video_path(video: dict) -> str:
+    return os.path.join(VIDEO_DIR, os.path.basename(video["video_url"]))
+
+async def mark_video_processing_failed(job: dict, error: str):
+    await save_video_media(job["video_id"], {"processing_status": "failed", "processing_error": error})
+
+async def queue_derived_media_jobs(video_id: str):
+    """Queue the jobs that build thumbnails and HLS packages from a video's file"""
+    await media_job_queue.enqueue("generate_thumbnails", video_id)
+    if HLS_RENDITION_HEIGHTS:
+        await media_job_queue.enqueue("package_hls", video_id)
+
+@media_job_handler("process_upload", on_failure=mark_video_processing_failed)
+async def process_uploaded_video(job: dict) -> dict:
+    """Probe the metadata of a newly uploaded video, then queue its thumbnails and HLS packaging"""
+    video = await db.videos.find_one({"id": job["video_id"]}, {"_id": 0, "id": 1, "video_url": 1})
+    if not video:
+        return {"skipped": "video no longer exists"}
+    
+    video_path = get_local_video_path(video)
+    if not os.path.exists(video_path):
+        raise RuntimeError(f"Video file is missing: {video_path}")
+    
+    media_info = await probe_media(video_path)
+    duration_minutes = get_duration_minutes(media_info)
+    fields = {
+        "duration_minutes": duration_minutes,
+        "media_info": media_info,
+        "processing_status": "ready"
+    }
+    moov_placement = await asyncio.to_thread(get_mp4_moov_placement, video_path)
+    if moov_placement:
+        fields["faststart"] = moov_placement == "before"
+    
+    await save_video_media(video["id"], fields, unset=["processing_error"])
+    
+    if moov_placement == "after":
+        # Thumbnails and HLS wait for the remux, so they read the final file and never race its replacement
+        await media_job_queue.enqueue("faststart_remux", video["id"], payload={"derive_media": True})
+    else:
+        await queue_derived_media_jobs(video["id"])
+    
+    return {"duration_minutes": duration_minutes}
+
+@media_job_handler("probe_media")
+async def probe_video_metadata(job: dict) -> dict:
+    """Fill in media_info and the real duration for an existing local video"""
+    video = await db.videos.find_one({"id": job["video_id"]}, {"_id": 0, "id": 1, "video_url": 1})
+    if not video:
+        return {"skipped": "video no longer exists"}
+    
+    media_info = await probe_media(get_local_video_path(video))
+    duration_minutes = get_duration_minutes(media_info)
+    await save_video_media(video["id"], {
+        "duration_minutes": duration_minutes,
+        "media_info": media_info
+    })
+    
+    return {"duration_minutes": duration_minutes}
+
+@app.post("/api/admin/videos/probe-backfill")
+async def backfill_video_metadata(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Queue metadata probes for local videos that have no media_info yet (admin only)"""
+    videos = await db.videos.find(
+        {"video_type": "local", "media_info": {"$exists": False}},
+        {"_id": 0, "id": 1, "blob_id": 1}
+    ).to_list(None)
+    videos = distinct_media_videos(videos)
+    for video in videos:
+        await media_job_queue.enqueue("probe_media", video["id"])
+    
+    return {"message": "Metadata probes queued", "queued": len(videos)}
+
+@app.get("/api/admin/media-jobs")
+async def list_media_jobs(
+    video_id: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """List media jobs, newest first (admin only)"""
+    query = {}
+    if video_id:
+        query["video_id"] = video_id
+    if status:
+        query["status"] = status
+    jobs = await db.media_jobs.find(query, {"_id": 0}).sort([("created_at", -1)]).limit(limit).to_list(limit)
+    return {"jobs": jobs}
+
+@app.get("/api/admin/media-jobs/{job_id}")
+async def get_media_job(job_id: str, current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Get the status of a media job (admin only)"""
+    job = await db.media_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job": job}
+
+# =========== HLS PACKAGING ===========
+
+# height -> (video kbps, audio kbps)
+HLS_LADDER = {360: (800, 96), 480: (1400, 128), 720: (2800, 128), 1080: (5000, 192)}
+# Empty disables packaging on upload
+HLS_RENDITION_HEIGHTS = [
+    int(height) for height in os.environ.get("HLS_RENDITIONS", "360,720,1080").split(",")
+    if height.strip() and int(height) in HLS_LADDER
+]
+HLS_SEGMENT_SECONDS = int(os.environ.get("HLS_SEGMENT_SECONDS", 6))
+HLS_PACKAGE_TIMEOUT_SECONDS = int(os.environ.get("HLS_PACKAGE_TIMEOUT_SECONDS", 6 * 3600))
+
+def select_hls_renditions(source_height: Optional[int]) -> List[int]:
+    """Configured rendition heights that do not upscale the source, always keeping at least one"""
+    heights = sorted(HLS_RENDITION_HEIGHTS or HLS_LADDER)
+    if not source_height:
+        return heights
+    return [height for height in heights if height <= source_height] or heights[:1]
+
+def build_hls_command(input_path: str, output_dir: str, heights: List[int], has_audio: bool) -> List[str]:
+    """One ffmpeg run that encodes every rendition with aligned keyframes and writes the master playlist"""
+    splits = "".join(f"[s{index}]" for index in range(len(heights)))
+    filters = [f"[0:v]split={len(heights)}{splits}"] + [
+        f"[s{index}]scale=-2:{height}[v{index}]" for index, height in enumerate(heights)
+    ]
+    command = ["ffmpeg", "-y", "-i", input_path, "-filter_complex", ";".join(filters)]
+    
+    stream_map = []
+    for index, height in enumerate(heights):
+        video_kbps, audio_kbps = HLS_LADDER[height]
+        command += [
+            "-map", f"[v{index}]",
+            f"-c:v:{index}", "libx264",
+            f"-b:v:{index}", f"{video_kbps}k",
+            f"-maxrate:v:{index}", f"{int(video_kbps * 1.07)}k",
+            f"-bufsize:v:{index}", f"{int(video_kbps * 1.5)}k"
+        ]
+        if has_audio:
+            command += ["-map", "0:a:0", f"-c:a:{index}", "aac", f"-b:a:{index}", f"{audio_kbps}k", "-ac", "2"]
+            stream_map.append(f"v:{index},a:{index},name:{height}p")
+        else:
+            stream_map.append(f"v:{index},name:{height}p")
+    
+    command += [
+        "-preset", "veryfast",
+        "-sc_threshold", "0",
+        # Keyframes on segment boundaries keep every rendition switchable at every segment
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(output_dir, "%v", "segment_%05d.ts"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(output_dir, "%v", "index.m3u8")
+    ]
+    return command
+
+async def mark_hls_packaging_failed(job: dict, error: str):
+    await save_video_media(job["video_id"], {"hls_status": "failed", "hls_error": error})
+
+@media_job_handler("package_hls", on_failure=mark_hls_packaging_failed)
+async def package_hls(job: dict) -> dict:
+    """Package a local video as an HLS ladder under UPLOAD_DIR/hls/<video_id>/<package_id>"""
+    video = await db.videos.find_one(
+        {"id": job["video_id"]},
+        {"_id": 0, "id": 1, "blob_id": 1, "video_url": 1, "media_info": 1}
+    )
+    if not video:
+        return {"skipped": "video no longer exists"}
+    
+    await save_video_media(video["id"], {"hls_status": "packaging"})
+    
+    video_path = get_local_video_path(video)
+    media_info = video.get("media_info") or await probe_media(video_path)
+    heights = select_hls_renditions(media_info.get("height"))
+    
+    media_key = get_media_key(video)
+    video_dir = os.path.join(HLS_DIR, media_key)
+    package_id = uuid.uuid4().hex[:12]
+    build_dir = os.path.join(video_dir, f".{package_id}.tmp")
+    package_dir = os.path.join(video_dir, package_id)
+    for height in heights:
+        os.makedirs(os.path.join(build_dir, f"{height}p"), exist_ok=True)
+    
+    try:
+        returncode, _, stderr = await run_media_command(
+            build_hls_command(video_path, build_dir, heights, bool(media_info.get("audio_codec"))),
+            timeout=HLS_PACKAGE_TIMEOUT_SECONDS
+        )
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {returncode}: {stderr.decode(errors='replace')[-500:]}")
+        # Publish the finished package in one step so players never see a partial ladder
+        os.replace(build_dir, package_dir)
+    finally:
+        if os.path.exists(build_dir):
+            shutil.rmtree(build_dir, ignore_errors=True)
+    
+    manifest_url = f"/files/hls/{media_key}/{package_id}/master.m3u8"
+    await save_video_media(video["id"], {
+        "hls_manifest_url": manifest_url,
+        "hls_renditions": [f"{height}p" for height in heights],
+        "hls_status": "ready"
+    }, unset=["hls_error"])
+    
+    # Earlier packages of this video are no longer referenced
+    for entry in os.listdir(video_dir):
+        if entry != package_id:
+            shutil.rmtree(os.path.join(video_dir, entry), ignore_errors=True)
+    
+    return {"manifest_url": manifest_url, "renditions": len(heights)}
+
+@app.post("/api/admin/videos/hls-backfill")
+async def backfill_hls_packages(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Queue HLS packaging for local videos that do not have a manifest yet (admin only)"""
+    videos = await db.videos.find(
+        {"video_type": "local", "hls_manifest_url": None, "hls_status": {"$ne": "packaging"}},
+        {"_id": 0, "id": 1, "blob_id": 1}
+    ).to_list(None)
+    videos = distinct_media_videos(videos)
+    for video in videos:
+        await save_video_media(video["id"], {"hls_status": "packaging"})
+        await media_job_queue.enqueue("package_hls", video["id"])
+    
+    return {"message": "HLS packaging queued", "queued": len(videos)}
+
+# =========== THUMBNAILS ===========
+
+THUMBNAIL_WIDTHS = [int(width) for width in os.environ.get("THUMBNAIL_WIDTHS", "320,640,1280").split(",") if width.strip()]
+# thumbnail_url keeps pointing at a single image for clients that do not use srcset
+THUMBNAIL_DEFAULT_WIDTH = 640
+THUMBNAIL_FORMATS = {
+    "webp": {"format": "WEBP", "quality": 78, "method": 4},
+    "jpg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}
+}
+THUMBNAIL_POSTER_SECONDS = 5
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_INTERVAL_SECONDS = 10
+# Long videos space their preview frames further apart instead of growing the sprite
+SPRITE_MAX_FRAMES = 300
+
+def render_thumbnail_sizes(frame_path: str, output_dir: str, url_prefix: str) -> List[dict]:
+    """Resize one frame to every configured width (never upscaling) in WebP and JPEG"""
+    sizes = []
+    with Image.open(frame_path) as source:
+        frame = source.convert("RGB")
+    for width in sorted({min(width, frame.width) for width in THUMBNAIL_WIDTHS}):
+        height = round(frame.height * width / frame.width)
+        resized = frame.resize((width, height), Image.LANCZOS)
+        size = {"width": width, "height": height}
+        for extension, options in THUMBNAIL_FORMATS.items():
+            filename = f"{width}.{extension}"
+            resized.save(os.path.join(output_dir, filename), **options)
+            size[f"{extension}_url"] = f"{url_prefix}/{filename}"
+        sizes.append(size)
+    return sizes
+
+def format_vtt_timestamp(seconds: float) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+def render_sprite_sheets(frame_paths: List[str], output_dir: str, interval_seconds: float) -> dict:
+    """Tile preview frames into sprite sheets and write a WebVTT index of xywh fragments"""
+    with Image.open(frame_paths[0]) as first:
+        tile_width, tile_height = first.size
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    cues = ["WEBVTT", ""]
+    sheets = 0
+    
+    for sheet_start in range(0, len(frame_paths), per_sheet):
+        sheet_frames = frame_paths[sheet_start:sheet_start + per_sheet]
+        rows = -(-len(sheet_frames) // SPRITE_COLUMNS)
+        sheet = Image.new("RGB", (tile_width * min(len(sheet_frames), SPRITE_COLUMNS), tile_height * rows))
+        sheet_name = f"sprite_{sheets}.jpg"
+        
+        for offset, frame_path in enumerate(sheet_frames):
+            x, y = (offset % SPRITE_COLUMNS) * tile_width, (offset // SPRITE_COLUMNS) * tile_height
+            with Image.open(frame_path) as frame:
+                sheet.paste(frame.convert("RGB").resize((tile_width, tile_height)), (x, y))
+            
+            start = (sheet_start + offset) * interval_seconds
+            cues += [
+                f"{format_vtt_timestamp(start)} --> {format_vtt_timestamp(start + interval_seconds)}",
+                f"{sheet_name}#xywh={x},{y},{tile_width},{tile_height}",
+                ""
+            ]
+        
+        sheet.save(os.path.join(output_dir, sheet_name), format="JPEG", quality=70, optimize=True)
+        sheets += 1
+    
+    with open(os.path.join(output_dir, "preview.vtt"), "w") as index:
+        index.write("\n".join(cues))
+    
+    return {"sheets": sheets, "frames": len(frame_paths), "tile_width": tile_width, "tile_height": tile_height}
+
+@media_job_handler("generate_thumbnails")
+async def generate_video_thumbnails(job: dict) -> dict:
+    """Build responsive thumbnails and the scrubbing sprite for a local video"""
+    video = await db.videos.find_one(
+        {"id": job["video_id"]},
+        {"_id": 0, "id": 1, "blob_id": 1, "video_url": 1, "media_info": 1}
+    )
+    if not video:
+        return {"skipped": "video no longer exists"}
+    
+    video_path = get_local_video_path(video)
+    media_info = video.get("media_info") or await probe_media(video_path)
+    duration_seconds = media_info["duration_ms"] / 1000
+    
+    media_key = get_media_key(video)
+    output_dir = os.path.join(THUMBNAIL_DIR, media_key)
+    url_prefix = f"/files/thumbnails/{media_key}"
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=UPLOAD_TMP_DIR)
+    try:
+        poster_path = os.path.join(work_dir, "poster.jpg")
+        await extract_video_frame(video_path, poster_path, min(THUMBNAIL_POSTER_SECONDS, duration_seconds / 2))
+        sizes = await asyncio.to_thread(render_thumbnail_sizes, poster_path, output_dir, url_prefix)
+        
+        interval = max(SPRITE_INTERVAL_SECONDS, duration_seconds / SPRITE_MAX_FRAMES)
+        returncode, _, stderr = await run_media_command([
+            "ffmpeg", "-i", video_path,
+            "-vf", f"fps=1/{interval:.3f},scale={SPRITE_TILE_WIDTH}:-2",
+            "-q:v", "5", "-y", os.path.join(work_dir, "frame_%05d.jpg")
+        ])
+        frame_paths = sorted(
+            os.path.join(work_dir, name) for name in os.listdir(work_dir) if name.startswith("frame_")
+        )
+        if returncode != 0 or not frame_paths:
+            raise RuntimeError(f"ffmpeg could not extract preview frames: {stderr.decode(errors='replace')[-300:]}")
+        sprite = await asyncio.to_thread(render_sprite_sheets, frame_paths, output_dir, interval)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    default_size = min(sizes, key=lambda size: abs(size["width"] - THUMBNAIL_DEFAULT_WIDTH))
+    await save_video_media(video["id"], {
+        "thumbnail_url": default_size["jpg_url"],
+        "thumbnails": sizes,
+        "preview_sprite": {
+            "vtt_url": f"{url_prefix}/preview.vtt",
+            "interval_seconds": interval,
+            **sprite
+        }
+    })
+    
+    return {"sizes": len(sizes), "sprite_sheets": sprite["sheets"]}
+
+@app.post("/api/admin/videos/thumbnail-backfill")
+async def backfill_video_thumbnails(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Queue responsive thumbnails and sprites for local videos that do not have them (admin only)"""
+    videos = await db.videos.find(
+        {"video_type": "local", "thumbnails": {"$exists": False}},
+        {"_id": 0, "id": 1, "blob_id": 1}
+    ).to_list(None)
+    videos = distinct_media_videos(videos)
+    for video in videos:
+        await media_job_queue.enqueue("generate_thumbnails", video["id"])
+    
+    return {"message": "Thumbnail generation queued", "queued": len(videos)}
+
+# =========== FASTSTART REMUX ===========
+
+FASTSTART_TIMEOUT_SECONDS = int(os.environ.get("FASTSTART_TIMEOUT_SECONDS", 1800))
+# Rewriting the container can shift its reported duration by a frame or so
+FASTSTART_DURATION_TOLERANCE_MS = 100
+
+async def queue_media_after_remux(job: dict, error: Optional[str] = None):
+    """Queue thumbnails and HLS for an upload whose processing waited on this remux"""
+    if job.get("payload", {}).get("derive_media") and await db.videos.find_one({"id": job["video_id"]}, {"_id": 1}):
+        # A failed remux leaves the original file in place, which still plays and can still be packaged
+        await queue_derived_media_jobs(job["video_id"])
+
+@media_job_handler("faststart_remux", on_failure=queue_media_after_remux)
+async def remux_faststart(job: dict) -> dict:
+    """Rewrite an MP4 with its moov atom ahead of the media data, copying the streams without re-encoding"""
+    video = await db.videos.find_one(
+        {"id": job["video_id"]},
+        {"_id": 0, "id": 1, "blob_id": 1, "video_url": 1, "media_info": 1}
+    )
+    if not video:
+        return {"skipped": "video no longer exists"}
+    
+    video_path = get_local_video_path(video)
+    moov_placement = await asyncio.to_thread(get_mp4_moov_placement, video_path)
+    if moov_placement != "after":
+        await queue_media_after_remux(job)
+        return {"skipped": f"moov is already {moov_placement} the media data" if moov_placement else "not an MP4 file"}
+    
+    extension = os.path.splitext(video_path)[1]
+    output_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4()}{extension}")
+    try:
+        returncode, _, stderr = await run_media_command([
+            "ffmpeg", "-i", video_path, "-map", "0", "-c", "copy", "-movflags", "+faststart", "-y", output_path
+        ], timeout=FASTSTART_TIMEOUT_SECONDS)
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {returncode}: {stderr.decode(errors='replace')[-500:]}")
+        
+        original = video.get("media_info") or await probe_media(video_path)
+        remuxed = await probe_media(output_path)
+        if abs(remuxed["duration_ms"] - original["duration_ms"]) > FASTSTART_DURATION_TOLERANCE_MS:
+            raise RuntimeError(f"Remuxed duration {remuxed['duration_ms']}ms does not match the original {original['duration_ms']}ms")
+        if await asyncio.to_thread(get_mp4_moov_placement, output_path) != "before":
+            raise RuntimeError("ffmpeg did not move the moov atom to the front")
+        
+        file_size = os.path.getsize(output_path)
+        if video.get("blob_id"):
+            # New bytes get a new content-addressed name, so copies of the old file cached as immutable stay correct
+            sha256 = await asyncio.to_thread(compute_file_sha256, output_path)
+            filename = f"{sha256}.faststart{extension}"
+            os.replace(output_path, os.path.join(VIDEO_DIR, filename))
+            await db.media_blobs.update_one(
+                {"sha256": video["blob_id"]},
+                {"$set": {"filename": filename, "size": file_size, "updated_at": datetime.utcnow()}}
+            )
+            await save_video_media(video["id"], {
+                "video_url": f"/files/videos/{filename}",
+                "file_size": file_size,
+                "faststart": True
+            })
+            # Requests and jobs that already opened the old file keep reading it until they close it
+            os.remove(video_path)
+        else:
+            os.replace(output_path, video_path)
+            await save_video_media(video["id"], {"file_size": file_size, "faststart": True})
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    
+    await queue_media_after_remux(job)
+    return {"file_size": file_size, "duration_ms": remuxed["duration_ms"]}
+
+@app.post("/api/admin/videos/faststart-backfill")
+async def backfill_faststart(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Queue faststart remuxes for local MP4s whose moov atom sits after the media data (admin only)"""
+    videos = await db.videos.find(
+        {"video_type": "local", "faststart": {"$ne": True}},
+        {"_id": 0, "id": 1, "blob_id": 1, "video_url": 1}
+    ).to_list(None)
+    videos = distinct_media_videos(videos)
+    pending = await db.media_jobs.distinct(
+        "video_id",
+        {"type": "faststart_remux", "status": {"$in": ["queued", "running"]}}
+    )
+    
+    queued = 0
+    for video in videos:
+        video_path = get_local_video_path(video)
+        if video["id"] in pending or not os.path.exists(video_path):
+            continue
+        try:
+            moov_placement = await asyncio.to_thread(get_mp4_moov_placement, video_path)
+        except (OSError, struct.error) as e:
+            print(f"Error reading atoms of {video_path}: {e}")
+            continue
+        
+        if moov_placement == "after":
+            await media_job_queue.enqueue("faststart_remux", video["id"])
+            queued += 1
+        elif moov_placement == "before":
+            await save_video_media(video["id"], {"faststart": True})
+    
+    return {"message": "Faststart remuxes queued", "scanned": len(videos), "queued": queued}
+
+# =========== IMAGE RESIZING ===========
+
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", os.path.join(UPLOAD_DIR, "image_cache"))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Requested widths snap up to one of these so the cache cannot be filled with arbitrary sizes
+IMAGE_WIDTHS = [160, 320, 480, 640, 960, 1280]
+IMAGE_MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+IMAGE_CACHE_CONTROL = "public, max-age=604800, stale-while-revalidate=86400"
+MAX_SOURCE_IMAGE_BYTES = 10 * 1024 * 1024
+# Remote sources are limited to known thumbnail hosts so the endpoint cannot be used to fetch arbitrary URLs
+IMAGE_FETCH_HOSTS = {"img.youtube.com", "i.ytimg.com"}
+
+image_resize_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("IMAGE_RESIZE_WORKERS", 2)),
+    thread_name_prefix="image-resize"
+)
+
+class ImageDiskCache:
+    """Content-addressed files on disk, evicted least recently used first once over max_bytes"""
+    
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # name -> size, least recently used first
+        self.total_bytes = 0
+        self.locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        os.makedirs(directory, exist_ok=True)
+        # Rebuild the index from disk, oldest access first, so the LRU survives restarts
+        existing = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                entry_stat = entry.stat()
+                existing.append((entry_stat.st_atime, entry.name, entry_stat.st_size))
+        for _, name, size in sorted(existing):
+            self.entries[name] = size
+            self.total_bytes += size
+    
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+    
+    def get(self, name: str) -> Optional[str]:
+        if name not in self.entries or not os.path.exists(self.path(name)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(name)
+        return self.path(name)
+    
+    def write(self, name: str, content: bytes) -> str:
+        """Write a file into place; runs on a worker thread, so it leaves the index alone"""
+        temp_path = self.path(f"{name}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(temp_path, "wb") as output:
+            output.write(content)
+        os.replace(temp_path, self.path(name))
+        return self.path(name)
+    
+    def record(self, name: str, size: int) -> List[str]:
+        """Index a written file and evict down to max_bytes; returns the evicted paths (event loop only)"""
+        self.total_bytes += size - self.entries.pop(name, 0)
+        self.entries[name] = size
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            evicted_name, evicted_size = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+            evicted.append(self.path(evicted_name))
+        return evicted
+    
+    @staticmethod
+    def remove_files(paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    async def put(self, name: str, content: bytes) -> str:
+        path = await asyncio.to_thread(self.write, name, content)
+        # The index is only touched on the event loop thread, like in get()
+        evicted = self.record(name, len(content))
+        if evicted:
+            await asyncio.to_thread(self.remove_files, evicted)
+        return path
+    
+    async def get_or_create(self, name: str, create) -> str:
+        """Return the cached file, building it at most once even under concurrent requests"""
+        path = self.get(name)
+        if path:
+            return path
+        lock = self.locks.setdefault(name, asyncio.Lock())
+        try:
+            async with lock:
+                if name in self.entries and os.path.exists(self.path(name)):
+                    return self.path(name)
+                content = await create()
+                return await self.put(name, content)
+        finally:
+            if not lock.locked():
+                self.locks.pop(name, None)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "files": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+image_disk_cache = ImageDiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+def download_image(url: str) -> bytes:
+    """Blocking download of a remote image, capped at MAX_SOURCE_IMAGE_BYTES"""
+    with requests.get(url, timeout=10, stream=True) as response:
+        response.raise_for_status()
+        content = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            content += chunk
+            if len(content) > MAX_SOURCE_IMAGE_BYTES:
+                raise ValueError("Source image is too large")
+        return bytes(content)
+
+class RequestsImageFetcher:
+    """Fetches remote source images with requests on a worker thread"""
+    
+    async def __call__(self, url: str) -> bytes:
+        return await asyncio.to_thread(download_image, url)
+
+def get_image_fetcher():
+    """Remote image fetcher; override this dependency to serve sources from elsewhere"""
+    return RequestsImageFetcher()
+
+def render_image(source: bytes, width: int, fmt: str) -> bytes:
+    """Downscale an image to width (never upscaling) and encode it as fmt"""
+    with Image.open(io.BytesIO(source)) as image:
+        image = image.convert("RGB")
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, **THUMBNAIL_FORMATS[fmt])
+    return output.getvalue()
+
+def get_local_image_path(source_url: str) -> str:
+    """Resolve a /files image URL to its path under UPLOAD_DIR, refusing anything outside it"""
+    path = os.path.realpath(os.path.join(UPLOAD_DIR, source_url[len("/files/"):]))
+    if not path.startswith(os.path.realpath(UPLOAD_DIR) + os.sep) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return path
+
+def get_image_source_key(source_url: str) -> str:
+    """Cache key for a source image that changes whenever its bytes may have changed"""
+    # Thumbnails are regenerated in place under the same URL, so local files are versioned
+    # by size and mtime; remote images are fetched once and kept, so their URL is enough
+    version = source_url
+    if source_url.startswith("/files/"):
+        entry_stat = os.stat(get_local_image_path(source_url))
+        version = f"{source_url}:{entry_stat.st_size}:{entry_stat.st_mtime_ns}"
+    return hashlib.sha256(version.encode()).hexdigest()[:32]
+
+async def load_source_image(source_url: str, fetcher) -> bytes:
+    """Read a local /files image from disk or fetch a remote one from an allowed host"""
+    if source_url.startswith("/files/"):
+        async with aiofiles.open(get_local_image_path(source_url), "rb") as source:
+            return await source.read()
+    
+    if urllib.parse.urlparse(source_url).hostname not in IMAGE_FETCH_HOSTS:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # maxresdefault does not exist for every YouTube video, hqdefault always does
+    candidates = [source_url]
+    if "maxresdefault" in source_url:
+        candidates.append(source_url.replace("maxresdefault", "hqdefault"))
+    for candidate in candidates:
+        try:
+            return await fetcher(candidate)
+        except Exception as e:
+            print(f"Error fetching image {candidate}: {e}")
+    raise HTTPException(status_code=502, detail="Could not fetch source image")
+
+@app.get("/api/images/{key}")
+async def get_resized_image(
+    key: str,
+    request: Request,
+    w: int = Query(640, ge=1, le=4096),
+    fmt: Optional[str] = Query(None),
+    fetcher=Depends(get_image_fetcher)
+):
+    """Serve a video's thumbnail resized to w and encoded as fmt (webp or jpg), from the disk cache"""
+    video = await db.videos.find_one({"id": key}, {"_id": 0, "thumbnail_url": 1})
+    if not video or not video.get("thumbnail_url"):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    if fmt is None:
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpg"
+    fmt = "jpg" if fmt == "jpeg" else fmt
+    if fmt not in IMAGE_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="fmt must be webp or jpg")
+    width = next((allowed for allowed in IMAGE_WIDTHS if allowed >= w), IMAGE_WIDTHS[-1])
+    
+    # Names derive from the source image's version, so a regenerated thumbnail gets new cache entries
+    source_key = get_image_source_key(video["thumbnail_url"])
+    name = f"{source_key}-{width}.{fmt}"
+    etag = f'"{name}"'
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": etag, "Vary": "Accept"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    async def load_source() -> bytes:
+        return await load_source_image(video["thumbnail_url"], fetcher)
+    
+    async def render() -> bytes:
+        source_path = await image_disk_cache.get_or_create(f"{source_key}.src", load_source)
+        async with aiofiles.open(source_path, "rb") as source:
+            source_bytes = await source.read()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(image_resize_executor, render_image, source_bytes, width, fmt)
+    
+    try:
+        path = await image_disk_cache.get_or_create(name, render)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Could not process image: {e}")
+    
+    return FileResponse(path, media_type=IMAGE_MEDIA_TYPES[fmt], headers=headers)
+
 # =========== ADMIN VIDEO UPLOAD ===========
 
+async def create_uploaded_video(video_id: str, metadata: dict, blob: dict, created: bool) -> tuple:
+    """Insert the videos record for a stored blob and queue its processing job unless the blob already has one"""
+    
+    # Duration and thumbnail are filled in by the process_upload job, or copied from the blob
+    video_data = {
+        "id": video_id,
+        "title": metadata["title"],
+        "description": metadata["description"],
+        "duration_minutes": 0,
+        "level": metadata["level"],
+        "accents": metadata["accents"],
+        "tags": metadata["tags"],
+        "instructor_name": metadata["instructor_name"],
+        "country": metadata["country"],
+        "topics": metadata["topics"],  # Topics instead of category
+        "thumbnail_url": None,
+        "is_premium": metadata["is_premium"],
+        "video_type": "local",
+        "video_url": f"/files/videos/{blob['filename']}",
+        "youtube_video_id": None,
+        "file_size": blob["size"],
+        "sha256": blob["sha256"],
+        "blob_id": blob["sha256"],
+        "processing_status": "processing",
+        "comment_count": 0,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+    
+    # Save to database
+    await db.videos.insert_one(video_data)
+    video_data.pop("_id", None)
+    
+    # Read the blob after inserting so fields saved by its jobs in between are not missed
+    stored = await db.media_blobs.find_one({"sha256": blob["sha256"]}, {"_id": 0, "media": 1})
+    media = (stored or {}).get("media") or {}
+    if media:
+        await db.videos.update_one({"id": video_id}, {"$set": media})
+        video_data.update(media)
+    
+    # A duplicate upload reuses the first copy's processing, finished or still running
+    if not created and media.get("processing_status") != "failed":
+        return video_data, None
+    
+    if not created:
+        await save_video_media(video_id, {"processing_status": "processing"}, unset=["processing_error"])
+        video_data["processing_status"] = "processing"
+        video_data.pop("processing_error", None)
+    job = await media_job_queue.enqueue("process_upload", video_id)
+    return video_data, job
+
+UPLOAD_FORM_FIELDS = ["title", "description", "level", "accents", "tags", "instructor_name", "country", "topics"]
+
 @app.post("/api/admin/videos/upload")
 async def upload_video(
-    title: str = Form(...),
-    description: str = Form(...),
-    level: VideoLevel = Form(...),
-    accents: str = Form(...),  # JSON string of accents
-    tags: str = Form(...),  # JSON string of tags
-    instructor_name: str = Form(...),
-    country: CountryType = Form(...),
-    topics: str = Form(...),  # JSON string of topics instead of category
-    is_premium: bool = Form(False),
-    video_file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(require_role(UserRole.ADMIN))
 ):
     """Upload a video file (Admin only)"""
     
-    # Validate file type
-    if not video_file.content_type or not video_file.content_type.startswith('video/'):
-        raise HTTPException(status_code=400, detail="File must be a video")
+    # Stream the video to disk without holding it in memory; the form is parsed by hand so the
+    # file is written once, into UPLOAD_TMP_DIR, and can be renamed into place from there
+    fields, saved_file = await save_multipart_upload(request, "video_file", MAX_VIDEO_UPLOAD_BYTES)
     
+    blob = None
     try:
-        # Parse JSON fields
-        accents_list = json.loads(accents) if accents else []
-        tags_list = json.loads(tags) if tags else []
-        topics_list = json.loads(topics) if topics else []
+        missing = [name for name in UPLOAD_FORM_FIELDS if name not in fields]
+        if not saved_file:
+            missing.append("video_file")
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Missing form fields: {', '.join(missing)}")
         
-        # Generate unique filename
-        video_id = str(uuid.uuid4())
-        file_extension = os.path.splitext(video_file.filename)[1]
-        video_filename = f"{video_id}{file_extension}"
-        video_path = os.path.join(VIDEO_DIR, video_filename)
+        # Validate file type
+        if not saved_file["content_type"].startswith('video/'):
+            raise HTTPException(status_code=400, detail="File must be a video")
         
-        # Save video file
-        with open(video_path, "wb") as buffer:
-            content = await video_file.read()
-            buffer.write(content)
+        try:
+            level = VideoLevel(fields["level"])
+            country = CountryType(fields["country"])
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
         
-        # Get video duration
-        duration_minutes = get_video_duration(video_path)
+        # Parse JSON fields
+        accents_list = json.loads(fields["accents"]) if fields["accents"] else []
+        tags_list = json.loads(fields["tags"]) if fields["tags"] else []
+        topics_list = json.loads(fields["topics"]) if fields["topics"] else []
+        is_premium = fields.get("is_premium", "false").lower() in ("true", "1", "on", "yes")
         
-        # Generate thumbnail
-        thumbnail_filename = f"{video_id}.jpg"
-        thumbnail_path = os.path.join(THUMBNAIL_DIR, thumbnail_filename)
-        thumbnail_generated = generate_thumbnail(video_path, thumbnail_path)
+        video_id = str(uuid.uuid4())
+        file_extension = os.path.splitext(saved_file["filename"])[1]
         
-        # Create video record
-        video_data = {
-            "id": video_id,
-            "title": title,
-            "description": description,
-            "duration_minutes": duration_minutes,
+        # Store the file by content hash
+        blob, created = await store_media_blob(saved_file, file_extension)
+        
+        video_data, job = await create_uploaded_video(video_id, {
+            "title": fields["title"],
+            "description": fields["description"],
             "level": level.value,
             "accents": accents_list,
             "tags": tags_list,
-            "instructor_name": instructor_name,
+            "instructor_name": fields["instructor_name"],
             "country": country.value,
-            "topics": topics_list,  # Topics instead of category
-            "thumbnail_url": f"/files/thumbnails/{thumbnail_filename}" if thumbnail_generated else None,
-            "is_premium": is_premium,
-            "video_type": "local",
-            "video_url": f"/files/videos/{video_filename}",
-            "youtube_video_id": None,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        
-        # Save to database
-        await db.videos.insert_one(video_data)
+            "topics": topics_list,
+            "is_premium": is_premium
+        }, blob, created)
         
         return {
-            "message": "Video uploaded successfully",
-            "video": video_data
+            "message": "Video uploaded, processing started" if job else "Video uploaded, reusing an identical file",
+            "video": video_data,
+            "job": job
         }
         
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON in accents, tags, or topics fields")
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up file if something goes wrong
-        if os.path.exists(video_path):
-            os.remove(video_path)
+        # Give back the blob reference if something goes wrong
+        if blob:
+            await release_media_blob(blob["sha256"])
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        # store_media_blob moves the temp file into place; anything left behind was rejected
+        if saved_file and os.path.exists(saved_file["path"]):
+            os.remove(saved_file["path"])
 
 @app.post("/api/admin/videos/youtube")
 async def add_youtube_video(
@@ -676,6 +2657,7 @@ async def add_youtube_video(
             "video_type": "youtube",
             "video_url": None,
             "youtube_video_id": video_id_youtube,
+            "comment_count": 0,
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
@@ -691,6 +2673,278 @@ async def add_youtube_video(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to add YouTube video: {str(e)}")
 
+@app.delete("/api/admin/videos/{video_id}")
+async def delete_video(video_id: str, current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Delete a video, its comments and list entries, and release its stored file (Admin only)"""
+    video = await db.videos.find_one_and_delete(
+        {"id": video_id},
+        {"_id": 0, "id": 1, "video_type": 1, "video_url": 1, "blob_id": 1}
+    )
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    video_metadata_cache.pop(video_id, None)
+    
+    comments = await db.comments.find({"video_id": video_id}, {"_id": 0, "id": 1}).to_list(None)
+    if comments:
+        await remove_comments([comment["id"] for comment in comments])
+        comment_thread_cache.invalidate(video_id)
+    await db.user_lists.delete_many({"video_id": video_id})
+    
+    file_deleted = False
+    if video.get("blob_id"):
+        # Other uploads of the same file keep it until their videos are deleted too
+        file_deleted = await release_media_blob(video["blob_id"])
+    elif video["video_type"] == "local" and video.get("video_url"):
+        video_path = get_local_video_path(video)
+        if os.path.exists(video_path):
+            os.remove(video_path)
+        for directory in (THUMBNAIL_DIR, HLS_DIR):
+            shutil.rmtree(os.path.join(directory, video_id), ignore_errors=True)
+        file_deleted = True
+    
+    return {"message": "Video deleted", "file_deleted": file_deleted}
+
+# =========== RESUMABLE UPLOADS ===========
+
+RESUMABLE_UPLOAD_DIR = os.path.join(UPLOAD_DIR, "resumable")
+os.makedirs(RESUMABLE_UPLOAD_DIR, exist_ok=True)
+
+MAX_UPLOAD_CHUNK_BYTES = int(os.environ.get("MAX_UPLOAD_CHUNK_BYTES", 64 * 1024 * 1024))
+UPLOAD_EXPIRY_HOURS = int(os.environ.get("UPLOAD_EXPIRY_HOURS", 24))
+UPLOAD_GC_INTERVAL_SECONDS = int(os.environ.get("UPLOAD_GC_INTERVAL_SECONDS", 600))
+upload_gc_task = None
+
+def get_resumable_upload_path(upload_id: str) -> str:
+    return os.path.join(RESUMABLE_UPLOAD_DIR, f"{upload_id}.part")
+
+def merge_byte_ranges(ranges: List[list]) -> List[list]:
+    """Merge possibly overlapping [start, end) ranges into sorted disjoint ones"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def describe_upload(upload: dict) -> dict:
+    """Public view of an upload session with received bytes and the ranges still missing"""
+    received = merge_byte_ranges(upload.get("received_ranges", []))
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append([position, start])
+        position = end
+    if position < upload["total_size"]:
+        missing.append([position, upload["total_size"]])
+    
+    return {
+        "id": upload["id"],
+        "status": upload["status"],
+        "filename": upload["filename"],
+        "total_size": upload["total_size"],
+        "received_bytes": sum(end - start for start, end in received),
+        "missing_ranges": missing,
+        "video_id": upload.get("video_id"),
+        "expires_at": upload["expires_at"]
+    }
+
+def compute_file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+async def collect_expired_uploads() -> int:
+    """Delete upload sessions past their expiry along with their partial files"""
+    expired = await db.video_uploads.find(
+        {"expires_at": {"$lt": datetime.utcnow()}},
+        {"_id": 0, "id": 1}
+    ).to_list(None)
+    for upload in expired:
+        temp_path = get_resumable_upload_path(upload["id"])
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    if expired:
+        await db.video_uploads.delete_many({"id": {"$in": [upload["id"] for upload in expired]}})
+    return len(expired)
+
+async def run_upload_gc():
+    """Background loop that removes abandoned uploads"""
+    while True:
+        await asyncio.sleep(UPLOAD_GC_INTERVAL_SECONDS)
+        try:
+            await collect_expired_uploads()
+        except Exception as e:
+            print(f"Error collecting expired uploads: {e}")
+
+@app.post("/api/admin/uploads")
+async def create_resumable_upload(
+    upload_request: ResumableUploadRequest,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Start a resumable video upload (admin only)"""
+    
+    if not upload_request.content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    if upload_request.total_size > MAX_VIDEO_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    
+    upload_id = str(uuid.uuid4())
+    
+    # Size the file up front so chunks can be written at their offsets in any order
+    async with aiofiles.open(get_resumable_upload_path(upload_id), "wb") as buffer:
+        await buffer.truncate(upload_request.total_size)
+    
+    now = datetime.utcnow()
+    upload_data = {
+        "id": upload_id,
+        "status": "uploading",
+        "filename": upload_request.filename,
+        "content_type": upload_request.content_type,
+        "total_size": upload_request.total_size,
+        "received_ranges": [],
+        "metadata": {
+            "title": upload_request.title,
+            "description": upload_request.description,
+            "level": upload_request.level.value,
+            "accents": upload_request.accents,
+            "tags": upload_request.tags,
+            "instructor_name": upload_request.instructor_name,
+            "country": upload_request.country.value,
+            "topics": upload_request.topics,
+            "is_premium": upload_request.is_premium
+        },
+        "created_by": current_user.id,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + timedelta(hours=UPLOAD_EXPIRY_HOURS)
+    }
+    await db.video_uploads.insert_one(upload_data)
+    
+    return {"message": "Upload created", "upload": describe_upload(upload_data)}
+
+@app.get("/api/admin/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str, current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Get upload progress and the byte ranges still to send (admin only)"""
+    upload = await db.video_uploads.find_one({"id": upload_id}, {"_id": 0})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"upload": describe_upload(upload)}
+
+@app.patch("/api/admin/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Write the request body at offset; chunks may arrive in parallel and out of order (admin only)"""
+    upload = await db.video_uploads.find_one(
+        {"id": upload_id},
+        {"_id": 0, "status": 1, "total_size": 1}
+    )
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload["status"] != "uploading":
+        raise HTTPException(status_code=409, detail=f"Upload is {upload['status']}")
+    if offset >= upload["total_size"]:
+        raise HTTPException(status_code=400, detail="Offset is past the end of the upload")
+    
+    limit = min(MAX_UPLOAD_CHUNK_BYTES, upload["total_size"] - offset)
+    written = 0
+    try:
+        async with aiofiles.open(get_resumable_upload_path(upload_id), "r+b") as buffer:
+            await buffer.seek(offset)
+            async for chunk in request.stream():
+                if written + len(chunk) > limit:
+                    raise HTTPException(status_code=413, detail="Chunk exceeds the upload size or chunk limit")
+                await buffer.write(chunk)
+                written += len(chunk)
+    finally:
+        # Whatever reached the disk counts, so a dropped connection resumes mid-chunk
+        if written:
+            now = datetime.utcnow()
+            await db.video_uploads.update_one(
+                {"id": upload_id},
+                {
+                    "$push": {"received_ranges": [offset, offset + written]},
+                    "$set": {"updated_at": now, "expires_at": now + timedelta(hours=UPLOAD_EXPIRY_HOURS)}
+                }
+            )
+    
+    upload = await db.video_uploads.find_one({"id": upload_id}, {"_id": 0})
+    return {"upload": describe_upload(upload)}
+
+@app.post("/api/admin/uploads/{upload_id}/finalize")
+async def finalize_resumable_upload(upload_id: str, current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Turn a fully received upload into a video (admin only)"""
+    upload = await db.video_uploads.find_one({"id": upload_id}, {"_id": 0})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload["status"] == "completed":
+        video = await db.videos.find_one({"id": upload["video_id"]}, {"_id": 0})
+        return {"message": "Video uploaded successfully", "video": video}
+    
+    progress = describe_upload(upload)
+    if progress["missing_ranges"]:
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "missing_ranges": progress["missing_ranges"]})
+    
+    # Claim the upload so concurrent finalize calls cannot both build a video
+    claimed = await db.video_uploads.find_one_and_update(
+        {"id": upload_id, "status": "uploading"},
+        {"$set": {"status": "finalizing", "updated_at": datetime.utcnow()}}
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Upload is already being finalized")
+    
+    temp_path = get_resumable_upload_path(upload_id)
+    video_id = str(uuid.uuid4())
+    blob = None
+    try:
+        sha256 = await asyncio.to_thread(compute_file_sha256, temp_path)
+        blob, created = await store_media_blob(
+            {"path": temp_path, "size": upload["total_size"], "sha256": sha256},
+            os.path.splitext(upload["filename"])[1]
+        )
+        video_data, job = await create_uploaded_video(video_id, upload["metadata"], blob, created)
+    except Exception as e:
+        if blob:
+            await release_media_blob(blob["sha256"])
+        # The upload can be finalized again unless the blob store already consumed its file
+        status = "uploading" if os.path.exists(temp_path) else "failed"
+        await db.video_uploads.update_one({"id": upload_id}, {"$set": {"status": status, "error": str(e)}})
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    await db.video_uploads.update_one(
+        {"id": upload_id},
+        {"$set": {"status": "completed", "video_id": video_id, "updated_at": datetime.utcnow()}}
+    )
+    
+    return {
+        "message": "Video uploaded, processing started" if job else "Video uploaded, reusing an identical file",
+        "video": video_data,
+        "job": job
+    }
+
+@app.delete("/api/admin/uploads/{upload_id}")
+async def abort_resumable_upload(upload_id: str, current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Abandon an upload and remove its partial file (admin only)"""
+    upload = await db.video_uploads.find_one_and_delete(
+        {"id": upload_id, "status": {"$ne": "finalizing"}},
+        {"_id": 0, "id": 1}
+    )
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    temp_path = get_resumable_upload_path(upload_id)
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    
+    return {"message": "Upload aborted"}
+
 # =========== USER LIST ENDPOINTS ===========
 
 @app.get("/api/user/list")
@@ -802,8 +3056,32 @@ async def set_daily_goal(
         upsert=True
     )
     
+    # Goal streaks depend on the target, so re-evaluate them against the new one
+    await recalculate_learner_streaks(current_user.id)
+    
     return {"message": "Daily goal updated", "daily_goal": request.daily_minutes_goal}
 
+@app.get("/api/user/daily-goal/status")
+async def get_daily_goal_status(current_user: User = Depends(require_role(UserRole.STUDENT))):
+    """Get today's minutes, goal progress and goal streak in a single read"""
+    
+    state = await db.learner_streaks.find_one({"learner_id": current_user.id}, {"_id": 0}) or {}
+    today = datetime.utcnow().date().isoformat()
+    
+    # The stored total belongs to whichever day was last written; a new day starts at zero
+    minutes_today = state.get("today_minutes", 0) if state.get("today_date") == today else 0
+    daily_goal = state.get("daily_minutes_goal")
+    if daily_goal is None:
+        daily_goal = await get_learner_daily_goal(current_user.id)
+    
+    return {
+        "daily_goal": daily_goal,
+        "minutes_watched_today": minutes_today,
+        "progress_percentage": min(minutes_today / daily_goal * 100, 100),
+        "goal_completed": state.get("last_goal_date") == today,
+        "streak_days": get_effective_streak(state.get("goal_streak", 0), state.get("last_goal_date"))
+    }
+
 # =========== MANUAL ACTIVITY ENDPOINTS ===========
 
 @app.post("/api/user/manual-activity")
@@ -813,16 +3091,20 @@ async def add_manual_activity(
 ):
     """Add manual activity (outside hours)"""
     
+    activity_date = parse_activity_date(request.date)
+    
     activity_data = {
         "id": str(uuid.uuid4()),
         "user_id": current_user.id,
-        "date": request.date,
+        "date": activity_date,
         "minutes": request.minutes,
         "activity_type": request.activity_type,
         "created_at": datetime.utcnow()
     }
     
     await db.manual_activities.insert_one(activity_data)
+    await record_daily_activity(current_user.id, activity_date, manual_minutes=request.minutes)
+    await record_level_minutes(current_user.id, {"manual_minutes": request.minutes})
     
     return {"message": "Manual activity added", "activity": activity_data}
 
@@ -837,7 +3119,7 @@ async def mark_video_watched(
     """Mark video as watched"""
     
     # Verify video exists
-    video = await db.videos.find_one({"id": video_id}, {"_id": 0})
+    video = await get_video_metadata(video_id)
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
     
@@ -851,14 +3133,16 @@ async def mark_video_watched(
         "last_watched_at": datetime.utcnow()
     }
     
-    await db.user_progress.update_one(
-        {
-            "session_id": session_id,
-            "video_id": video_id
-        },
-        {"$set": progress_data},
-        upsert=True
+    minutes_delta = await save_watch_progress(progress_data)
+    learner_id = get_learner_id(session_id, current_user)
+    await record_daily_activity(
+        learner_id,
+        progress_data["last_watched_at"].date().isoformat(),
+        minutes=minutes_delta,
+        video_id=video_id
     )
+    if minutes_delta:
+        await record_level_minutes(learner_id, build_level_minutes_increments(video, minutes_delta))
     
     return {"message": "Video marked as watched", "progress": progress_data}
 
@@ -870,68 +3154,681 @@ async def unmark_video_watched(
 ):
     """Unmark video as watched"""
     
-    result = await db.user_progress.delete_one({
+    removed = await db.user_progress.find_one_and_delete({
         "session_id": session_id,
         "video_id": request.video_id
     })
     
-    if result.deleted_count == 0:
+    if not removed:
         raise HTTPException(status_code=404, detail="Video progress not found")
     
+    learner_id = removed.get("user_id") or session_id
+    credited_days = removed.get("credited_days")
+    if credited_days is None and isinstance(removed.get("last_watched_at"), datetime):
+        # Records from before per-day credits were kept: take everything back from the last day
+        credited_days = {removed["last_watched_at"].date().isoformat(): removed.get("minutes_watched", 0)}
+    
+    # Take the removed minutes back out of the days they were credited to
+    for date, minutes in (credited_days or {}).items():
+        await db.daily_activity.update_one(
+            {"learner_id": learner_id, "date": date},
+            {"$inc": {"minutes": -minutes}, "$pull": {"video_ids": request.video_id}}
+        )
+        # Only the approximate reversal of older records can overshoot
+        await db.daily_activity.update_one(
+            {"learner_id": learner_id, "date": date, "minutes": {"$lt": 0}},
+            {"$set": {"minutes": 0}}
+        )
+    if credited_days:
+        await recalculate_learner_streaks(learner_id)
+    
+    # The level counters received exactly the minutes credited to the rollups
+    credited_minutes = removed.get("credited_minutes", removed.get("minutes_watched", 0))
+    video = await get_video_metadata(request.video_id)
+    if video and credited_minutes:
+        await record_level_minutes(learner_id, build_level_minutes_increments(video, -credited_minutes))
+    
     return {"message": "Video unmarked as watched"}
 
+# =========== COMMENT THREADING ===========
+
+COMMENT_PAGE_SIZE = 20
+COMMENT_REPLY_PREVIEW_SIZE = 3
+COMMENT_MAX_DEPTH = int(os.environ.get("COMMENT_MAX_DEPTH", 8))
+COMMENT_SORT = [("pinned", -1), ("created_at", -1), ("id", -1)]
+REPLY_SORT = [("path", 1)]
+# Sorts after every character that can appear in a path segment
+COMMENT_PATH_END = "~"
+
+def comment_path_segment(comment_id: str, created_at: datetime) -> str:
+    """Sortable path segment for a comment: creation time, then id to break ties"""
+    return f"{created_at.strftime('%Y%m%d%H%M%S%f')}.{comment_id}/"
+
+def build_comment_path_fields(comment_id: str, created_at: datetime, parent: Optional[dict] = None) -> dict:
+    """root_id, path and depth for a new comment placed under parent (None for top-level)"""
+    segment = comment_path_segment(comment_id, created_at)
+    if not parent:
+        return {"root_id": comment_id, "path": segment, "depth": 0}
+    return {"root_id": parent["root_id"], "path": parent["path"] + segment, "depth": parent["depth"] + 1}
+
+def get_comment_ancestor_ids(path: str) -> List[str]:
+    """Ids along a materialized path from the root down to the comment itself"""
+    return [segment.split(".", 1)[1] for segment in path.rstrip("/").split("/")]
+
+def build_subtree_filter(comment: dict) -> dict:
+    """Range filter matching a comment and everything below it, in display order on (root_id, path)"""
+    return {"root_id": comment["root_id"], "path": {"$gte": comment["path"], "$lt": comment["path"] + COMMENT_PATH_END}}
+
+def encode_cursor(values: list) -> str:
+    """Encode the sort key of the last item on a page as an opaque cursor"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Decode a cursor produced by encode_cursor, rejecting anything malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("unexpected cursor shape")
+        return values
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def build_comment_page_filter(cursor: str) -> dict:
+    """Filter for top-level comments after the cursor in (pinned, created_at, id) descending order"""
+    pinned, created_at, comment_id = decode_cursor(cursor, 3)
+    created_at = datetime.fromisoformat(created_at)
+    return {"$or": [
+        {"pinned": {"$lt": pinned}},
+        {"pinned": pinned, "created_at": {"$lt": created_at}},
+        {"pinned": pinned, "created_at": created_at, "id": {"$lt": comment_id}}
+    ]}
+
+async def get_reply_previews(roots: List[dict], preview_size: int = COMMENT_REPLY_PREVIEW_SIZE) -> dict:
+    """Get the first replies in display order below each thread root"""
+    if not roots:
+        return {}
+    
+    # One round trip for the whole page; the correlated $lookup walks the (root_id, path)
+    # index for each root and stops after preview_size replies, however big the thread is
+    pipeline = [
+        {"$match": {"id": {"$in": [root["id"] for root in roots]}}},
+        {"$lookup": {
+            "from": "comments",
+            "localField": "root_id",
+            "foreignField": "root_id",
+            "pipeline": [
+                {"$match": {"depth": {"$gt": 0}, "deleted": {"$ne": True}}},
+                {"$sort": dict(REPLY_SORT)},
+                {"$limit": preview_size},
+                {"$project": {"_id": 0}}
+            ],
+            "as": "replies"
+        }},
+        {"$project": {"_id": 0, "id": 1, "replies": 1}}
+    ]
+    
+    previews = {root["id"]: [] for root in roots}
+    async for root in db.comments.aggregate(pipeline):
+        previews[root["id"]] = root["replies"]
+    return previews
+
+async def mark_user_liked(comments: List[dict], current_user: Optional[User]):
+    """Set user_liked on each comment, resolving the viewer's likes in one query"""
+    liked_comment_ids = set()
+    if current_user and comments:
+        likes = await db.user_comment_likes.find(
+            {
+                "user_id": current_user.id,
+                "comment_id": {"$in": [comment["id"] for comment in comments]}
+            },
+            {"_id": 0, "comment_id": 1}
+        ).to_list(len(comments))
+        liked_comment_ids = {like["comment_id"] for like in likes}
+    
+    for comment in comments:
+        comment["user_liked"] = comment["id"] in liked_comment_ids
+
+class CommentThreadCache:
+    """Byte-bounded LRU of rendered comment pages, grouped per video for invalidation"""
+    
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.videos = OrderedDict()  # video_id -> {page_key: (expires_at, serialized page)}
+        # Bumped on every invalidation so a page loaded across one is not cached
+        self.generations = {}
+        self.epoch = 0
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, video_id: str, page_key: str) -> Optional[dict]:
+        entry = self.videos.get(video_id, {}).get(page_key)
+        if not entry or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.videos.move_to_end(video_id)
+        # Each hit gets its own copy so per-viewer flags never leak into the cache
+        return json.loads(entry[1])
+    
+    def generation(self, video_id: str) -> tuple:
+        return self.epoch, self.generations.get(video_id, 0)
+    
+    def set(self, video_id: str, page_key: str, page: dict, generation: tuple):
+        # A write invalidated the video while the page was loading, so the page may be stale
+        if generation != self.generation(video_id):
+            return
+        serialized = json.dumps(page, default=lambda value: value.isoformat())
+        if len(serialized) > self.max_bytes:
+            return
+        pages = self.videos.setdefault(video_id, {})
+        if page_key in pages:
+            self.total_bytes -= len(pages[page_key][1])
+        pages[page_key] = (time.monotonic() + self.ttl_seconds, serialized)
+        self.total_bytes += len(serialized)
+        self.videos.move_to_end(video_id)
+        
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.videos.popitem(last=False)
+            self.total_bytes -= sum(len(entry[1]) for entry in evicted.values())
+            self.evictions += 1
+    
+    def invalidate(self, video_id: str):
+        self.generations[video_id] = self.generations.get(video_id, 0) + 1
+        pages = self.videos.pop(video_id, None)
+        if pages:
+            self.total_bytes -= sum(len(entry[1]) for entry in pages.values())
+            self.invalidations += 1
+    
+    def clear(self):
+        self.invalidations += len(self.videos)
+        self.epoch += 1
+        self.generations.clear()
+        self.videos.clear()
+        self.total_bytes = 0
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "videos": len(self.videos),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+class LikeCounterBuffer:
+    """Accumulates like/unlike deltas per comment and flushes them as batched $inc updates"""
+    
+    def __init__(self, flush_interval_seconds: float):
+        self.flush_interval_seconds = flush_interval_seconds
+        self.pending = {}  # comment_id -> [video_id, delta]
+        self.in_flight = {}  # deltas being written by the current flush
+        self.flushes = 0
+        self.flushed_updates = 0
+        self.buffered_likes = 0
+        self.task = None
+    
+    def add(self, comment_id: str, video_id: str, delta: int):
+        entry = self.pending.setdefault(comment_id, [video_id, 0])
+        entry[1] += delta
+        self.buffered_likes += 1
+    
+    def pending_delta(self, comment_id: str) -> int:
+        return sum(entry[1] for entry in (self.pending.get(comment_id), self.in_flight.get(comment_id)) if entry)
+    
+    def apply(self, comments: List[dict]):
+        """Add not-yet-persisted deltas to like_count so reads stay consistent"""
+        for comment in comments:
+            comment["like_count"] = comment.get("like_count", 0) + self.pending_delta(comment["id"])
+    
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        changed = {comment_id: entry for comment_id, entry in batch.items() if entry[1]}
+        if not changed:
+            return
+        
+        self.in_flight = changed
+        try:
+            await db.comments.bulk_write([
+                UpdateOne({"id": comment_id}, {"$inc": {"like_count": delta}})
+                for comment_id, (_, delta) in changed.items()
+            ], ordered=False)
+        except Exception as e:
+            # Put the deltas back so the next flush retries them
+            print(f"Error flushing like counters: {e}")
+            for comment_id, (video_id, delta) in changed.items():
+                entry = self.pending.setdefault(comment_id, [video_id, 0])
+                entry[1] += delta
+            return
+        finally:
+            self.in_flight = {}
+        
+        self.flushes += 1
+        self.flushed_updates += len(changed)
+        # Cached pages hold the old persisted counts, which no longer match once the deltas are gone
+        for video_id in {video_id for video_id, _ in changed.values()}:
+            comment_thread_cache.invalidate(video_id)
+    
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            await self.flush()
+    
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+    
+    def stats(self) -> dict:
+        return {
+            "pending_comments": len(self.pending),
+            "buffered_likes": self.buffered_likes,
+            "flushes": self.flushes,
+            "flushed_updates": self.flushed_updates
+        }
+
+like_counter_buffer = LikeCounterBuffer(
+    flush_interval_seconds=float(os.environ.get("LIKE_FLUSH_INTERVAL_SECONDS", 2))
+)
+
+# TTL bounds staleness when several workers each hold their own cache
+comment_thread_cache = CommentThreadCache(
+    max_bytes=int(os.environ.get("COMMENT_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    ttl_seconds=int(os.environ.get("COMMENT_CACHE_TTL_SECONDS", 60))
+)
+
+# =========== COMMENT RATE LIMITING ===========
+
+class CommentRateLimiter:
+    """Per-user token bucket plus a short-lived fingerprint set that rejects repeated submissions"""
+    
+    def __init__(self, per_minute: float, burst: int, duplicate_ttl_seconds: int):
+        self.refill_per_second = per_minute / 60
+        self.burst = burst
+        self.duplicate_ttl_seconds = duplicate_ttl_seconds
+        self.buckets = OrderedDict()  # user_id -> (tokens, updated_at), least recently used first
+        self.fingerprints = OrderedDict()  # fingerprint -> expires_at, oldest first
+        self.allowed = 0
+        self.rate_limited = 0
+        self.duplicates = 0
+    
+    @staticmethod
+    def fingerprint(user_id: str, video_id: str, text: str) -> str:
+        normalized = " ".join(text.lower().split())
+        return hashlib.sha256(f"{user_id}\0{video_id}\0{normalized}".encode()).hexdigest()
+    
+    def _prune(self, now: float):
+        while self.fingerprints and next(iter(self.fingerprints.values())) <= now:
+            self.fingerprints.popitem(last=False)
+        # A bucket idle long enough to refill completely is the same as no bucket
+        refill_seconds = self.burst / self.refill_per_second if self.refill_per_second else float("inf")
+        while self.buckets and next(iter(self.buckets.values()))[1] + refill_seconds <= now:
+            self.buckets.popitem(last=False)
+    
+    def check(self, user_id: str, video_id: str, text: str) -> str:
+        """Admit one comment or raise 409/429; returns the fingerprint recorded for it"""
+        now = time.monotonic()
+        self._prune(now)
+        
+        fingerprint = self.fingerprint(user_id, video_id, text)
+        if fingerprint in self.fingerprints:
+            self.duplicates += 1
+            raise HTTPException(status_code=409, detail="Duplicate comment")
+        
+        tokens, updated_at = self.buckets.pop(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.refill_per_second)
+        if tokens < 1:
+            self.buckets[user_id] = (tokens, now)
+            self.rate_limited += 1
+            retry_after = math.ceil((1 - tokens) / self.refill_per_second) if self.refill_per_second else 60
+            raise HTTPException(
+                status_code=429,
+                detail="Too many comments, please slow down",
+                headers={"Retry-After": str(retry_after)}
+            )
+        
+        self.buckets[user_id] = (tokens - 1, now)
+        self.fingerprints[fingerprint] = now + self.duplicate_ttl_seconds
+        self.allowed += 1
+        return fingerprint
+    
+    def forget(self, fingerprint: str):
+        """Let a submission be retried after it failed for reasons other than being a duplicate"""
+        self.fingerprints.pop(fingerprint, None)
+    
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "rate_limited": self.rate_limited,
+            "duplicates": self.duplicates,
+            "tracked_users": len(self.buckets),
+            "fingerprints": len(self.fingerprints)
+        }
+
+comment_rate_limiter = CommentRateLimiter(
+    per_minute=float(os.environ.get("COMMENT_RATE_PER_MINUTE", 6)),
+    burst=int(os.environ.get("COMMENT_RATE_BURST", 5)),
+    duplicate_ttl_seconds=int(os.environ.get("COMMENT_DUPLICATE_TTL_SECONDS", 60))
+)
+
+# =========== LIVE COMMENT EVENTS ===========
+
+# "local" fans events out in this process only; "changestream" relays them through
+# MongoDB so every worker's subscribers see events written by any worker
+COMMENT_EVENTS_SOURCE = os.environ.get("COMMENT_EVENTS_SOURCE", "local")
+COMMENT_STREAM_QUEUE_SIZE = int(os.environ.get("COMMENT_STREAM_QUEUE_SIZE", 100))
+COMMENT_STREAM_HEARTBEAT_SECONDS = 15
+COMMENT_EVENT_RETENTION_SECONDS = 3600
+
+class CommentEventBroker:
+    """In-process pub/sub of comment events keyed by video, with bounded subscriber queues"""
+    
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers = {}  # video_id -> set of queues
+        self.published = 0
+        self.dropped = 0
+        self.watch_task = None
+    
+    def subscribe(self, video_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(video_id, set()).add(queue)
+        return queue
+    
+    def unsubscribe(self, video_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(video_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[video_id]
+    
+    def publish(self, video_id: str, event: dict):
+        self.published += 1
+        for queue in self.subscribers.get(video_id, ()):
+            # A slow subscriber loses its oldest events instead of holding up everyone else
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+    
+    async def watch(self):
+        """Relay events inserted by any worker into local subscribers"""
+        while True:
+            try:
+                async with db.comment_events.watch([{"$match": {"operationType": "insert"}}]) as stream:
+                    async for change in stream:
+                        event = change["fullDocument"]
+                        self.publish(event["video_id"], {"type": event["type"], "data": event["data"]})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Comment event stream error: {e}")
+                await asyncio.sleep(5)
+    
+    def start(self):
+        if COMMENT_EVENTS_SOURCE == "changestream" and self.watch_task is None:
+            self.watch_task = asyncio.create_task(self.watch())
+    
+    def stop(self):
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            self.watch_task = None
+    
+    def stats(self) -> dict:
+        return {
+            "source": COMMENT_EVENTS_SOURCE,
+            "videos": len(self.subscribers),
+            "subscribers": sum(len(queues) for queues in self.subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+comment_event_broker = CommentEventBroker(queue_size=COMMENT_STREAM_QUEUE_SIZE)
+
+async def publish_comment_event(video_id: str, event_type: str, data: dict):
+    """Push a comment event to every subscriber of the video"""
+    if COMMENT_EVENTS_SOURCE == "changestream":
+        await db.comment_events.insert_one({
+            "video_id": video_id,
+            "type": event_type,
+            "data": data,
+            "created_at": datetime.utcnow()
+        })
+    else:
+        comment_event_broker.publish(video_id, {"type": event_type, "data": data})
+
+# =========== COMMENT DELETION ===========
+
+# "hard" deletes a comment subtree immediately; "soft" hides it and leaves the
+# removal to a background purge
+COMMENT_DELETE_MODE = os.environ.get("COMMENT_DELETE_MODE", "hard")
+COMMENT_PURGE_INTERVAL_SECONDS = int(os.environ.get("COMMENT_PURGE_INTERVAL_SECONDS", 300))
+COMMENT_PURGE_BATCH_SIZE = 1000
+comment_purge_task = None
+
+async def remove_comments(comment_ids: List[str]) -> int:
+    """Delete comments and their likes in bulk, or mark them for the background purge"""
+    if COMMENT_DELETE_MODE == "soft":
+        result = await db.comments.update_many(
+            {"id": {"$in": comment_ids}, "deleted": {"$ne": True}},
+            {"$set": {"deleted": True, "deleted_at": datetime.utcnow()}}
+        )
+        return result.modified_count
+    
+    result = await db.comments.delete_many({"id": {"$in": comment_ids}})
+    await db.user_comment_likes.delete_many({"comment_id": {"$in": comment_ids}})
+    return result.deleted_count
+
+async def purge_deleted_comments() -> int:
+    """Hard-delete soft-deleted comments and their likes in batches"""
+    purged = 0
+    while True:
+        deleted_comments = await db.comments.find(
+            {"deleted": True},
+            {"_id": 0, "id": 1}
+        ).limit(COMMENT_PURGE_BATCH_SIZE).to_list(COMMENT_PURGE_BATCH_SIZE)
+        comment_ids = [comment["id"] for comment in deleted_comments]
+        if not comment_ids:
+            return purged
+        await db.user_comment_likes.delete_many({"comment_id": {"$in": comment_ids}})
+        result = await db.comments.delete_many({"id": {"$in": comment_ids}, "deleted": True})
+        purged += result.deleted_count
+
+async def run_comment_purge():
+    """Background loop that purges soft-deleted comments"""
+    while True:
+        await asyncio.sleep(COMMENT_PURGE_INTERVAL_SECONDS)
+        try:
+            await purge_deleted_comments()
+        except Exception as e:
+            print(f"Error purging deleted comments: {e}")
+
+async def sweep_orphaned_comment_data() -> dict:
+    """Remove replies whose parent is gone and likes whose comment is gone"""
+    orphaned_replies = await db.comments.aggregate([
+        {"$match": {"parent_comment_id": {"$ne": None}}},
+        {"$lookup": {"from": "comments", "localField": "parent_comment_id", "foreignField": "id", "as": "parent"}},
+        {"$match": {"parent": {"$size": 0}}},
+        {"$project": {"_id": 0, "id": 1, "root_id": 1, "path": 1}}
+    ], allowDiskUse=True).to_list(None)
+    # Anything nested under an orphan goes with it
+    removed_replies = 0
+    for reply in orphaned_replies:
+        subtree_filter = build_subtree_filter(reply) if reply.get("path") else {"id": reply["id"]}
+        result = await db.comments.delete_many(subtree_filter)
+        removed_replies += result.deleted_count
+    
+    orphaned_likes = await db.user_comment_likes.aggregate([
+        {"$lookup": {"from": "comments", "localField": "comment_id", "foreignField": "id", "as": "comment"}},
+        {"$match": {"comment": {"$size": 0}}},
+        {"$project": {"_id": 1}}
+    ], allowDiskUse=True).to_list(None)
+    like_ids = [like["_id"] for like in orphaned_likes]
+    if like_ids:
+        await db.user_comment_likes.delete_many({"_id": {"$in": like_ids}})
+    
+    return {"orphaned_replies_removed": removed_replies, "orphaned_likes_removed": len(like_ids)}
+
+async def migrate_comment_paths() -> int:
+    """Give comments stored before materialized paths their root_id, path and depth"""
+    migrated = 0
+    for video_id in await db.comments.distinct("video_id", {"path": {"$exists": False}}):
+        comments = await db.comments.find(
+            {"video_id": video_id},
+            {"_id": 0, "id": 1, "parent_comment_id": 1, "created_at": 1, "root_id": 1, "path": 1, "depth": 1}
+        ).sort([("created_at", 1), ("id", 1)]).to_list(None)
+        comments_by_id = {comment["id"]: comment for comment in comments}
+        
+        # Replies are always newer than their parent, so one pass in creation order sees parents first
+        operations = []
+        for comment in comments:
+            if comment.get("path"):
+                continue
+            parent = comments_by_id.get(comment.get("parent_comment_id"))
+            if comment.get("parent_comment_id") and not (parent and parent.get("path")):
+                continue  # orphaned reply, left for sweep_orphaned_comment_data
+            comment.update(build_comment_path_fields(comment["id"], comment["created_at"], parent))
+            operations.append(UpdateOne(
+                {"id": comment["id"]},
+                {"$set": {"root_id": comment["root_id"], "path": comment["path"], "depth": comment["depth"]}}
+            ))
+        
+        for start in range(0, len(operations), ROLLUP_BACKFILL_BATCH_SIZE):
+            await db.comments.bulk_write(operations[start:start + ROLLUP_BACKFILL_BATCH_SIZE], ordered=False)
+        migrated += len(operations)
+    
+    return migrated
+
 # =========== COMMENT ENDPOINTS ===========
 
+@app.get("/api/comments/{video_id}/stream")
+async def stream_video_comments(video_id: str, request: Request):
+    """Stream new, pinned, deleted and like-count comment events as Server-Sent Events"""
+    
+    async def event_stream():
+        queue = comment_event_broker.subscribe(video_id)
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=COMMENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                data = json.dumps(event["data"], default=lambda value: value.isoformat())
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+        finally:
+            comment_event_broker.unsubscribe(video_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/comments/{video_id}")
-async def get_video_comments(video_id: str, current_user: Optional[User] = Depends(get_current_user)):
-    """Get comments for a specific video with threading support"""
+async def get_video_comments(
+    video_id: str,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(COMMENT_PAGE_SIZE, ge=1, le=100),
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    """Get a page of top-level comments for a video, each with its first replies"""
+    page_key = f"{cursor or ''}:{limit}"
+    page = comment_thread_cache.get(video_id, page_key)
+    if page is None:
+        generation = comment_thread_cache.generation(video_id)
+        page = await load_comment_page(video_id, cursor, limit)
+        comment_thread_cache.set(video_id, page_key, page, generation)
+    
+    # Like flags are per viewer and buffered likes are not persisted yet, so both are overlaid on the shared page
+    all_comments = page["comments"] + [reply for comment in page["comments"] for reply in comment["replies"]]
+    await mark_user_liked(all_comments, current_user)
+    like_counter_buffer.apply(all_comments)
+    
+    return page
+
+async def load_comment_page(video_id: str, cursor: Optional[str], limit: int) -> dict:
+    """Query and thread one page of comments for a video, without viewer-specific fields"""
     # Verify video exists
-    video = await db.videos.find_one({"id": video_id}, {"_id": 0})
+    video = await db.videos.find_one({"id": video_id}, {"_id": 0, "id": 1, "comment_count": 1})
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Get all comments for this video
-    all_comments = await db.comments.find(
-        {"video_id": video_id},
-        {"_id": 0}
-    ).sort([("pinned", -1), ("created_at", -1)]).to_list(500)
-    
-    # Separate top-level comments and replies
-    top_level_comments = []
-    replies_map = {}
+    query = {"video_id": video_id, "parent_comment_id": None, "deleted": {"$ne": True}}
+    if cursor:
+        query.update(build_comment_page_filter(cursor))
     
-    for comment in all_comments:
-        # Add user_liked field if user is authenticated
-        if current_user:
-            user_like = await db.user_comment_likes.find_one({
-                "user_id": current_user.id,
-                "comment_id": comment["id"]
-            })
-            comment["user_liked"] = user_like is not None
-        else:
-            comment["user_liked"] = False
-        
-        if comment.get("parent_comment_id"):
-            # This is a reply
-            parent_id = comment["parent_comment_id"]
-            if parent_id not in replies_map:
-                replies_map[parent_id] = []
-            replies_map[parent_id].append(comment)
-        else:
-            # This is a top-level comment
-            comment["replies"] = []
-            top_level_comments.append(comment)
+    # Fetch one extra comment to know whether another page exists
+    comments = await db.comments.find(query, {"_id": 0}).sort(COMMENT_SORT).limit(limit + 1).to_list(limit + 1)
+    has_more = len(comments) > limit
+    comments = comments[:limit]
     
-    # Attach replies to their parent comments
-    for comment in top_level_comments:
-        comment_id = comment["id"]
-        if comment_id in replies_map:
-            comment["replies"] = sorted(replies_map[comment_id], key=lambda x: x["created_at"])
+    previews = await get_reply_previews(comments)
+    for comment in comments:
+        comment["replies"] = previews[comment["id"]]
+        comment.setdefault("reply_count", 0)
     
+    last = comments[-1] if comments else None
     return {
         "video_id": video_id,
-        "comments": top_level_comments,
-        "total": len(all_comments)
+        "comments": comments,
+        "total": video.get("comment_count", 0),
+        "has_more": has_more,
+        "next_cursor": encode_cursor([last["pinned"], last["created_at"], last["id"]]) if has_more else None
+    }
+
+@app.get("/api/comments/{comment_id}/replies")
+async def get_comment_replies(
+    comment_id: str,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(COMMENT_PAGE_SIZE, ge=1, le=100),
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    """Page through every reply below a comment, at any depth, in thread display order"""
+    parent = await db.comments.find_one(
+        {"id": comment_id, "deleted": {"$ne": True}},
+        {"_id": 0, "root_id": 1, "path": 1}
+    )
+    if not parent:
+        raise HTTPException(status_code=404, detail="Comment not found")
+    
+    # The subtree is one contiguous range of paths, so a page is a single indexed range scan
+    after_path = decode_cursor(cursor, 1)[0] if cursor else parent["path"]
+    query = {
+        "root_id": parent["root_id"],
+        "path": {"$gt": after_path, "$lt": parent["path"] + COMMENT_PATH_END},
+        "deleted": {"$ne": True}
+    }
+    
+    replies = await db.comments.find(query, {"_id": 0}).sort(REPLY_SORT).limit(limit + 1).to_list(limit + 1)
+    has_more = len(replies) > limit
+    replies = replies[:limit]
+    
+    await mark_user_liked(replies, current_user)
+    like_counter_buffer.apply(replies)
+    
+    last = replies[-1] if replies else None
+    return {
+        "comment_id": comment_id,
+        "replies": replies,
+        "has_more": has_more,
+        "next_cursor": encode_cursor([last["path"]]) if has_more else None
     }
 
 @app.post("/api/comments/{video_id}")
@@ -942,34 +3839,62 @@ async def create_comment(
 ):
     """Create a new comment (requires authentication)"""
     
-    # Verify video exists
-    video = await db.videos.find_one({"id": video_id}, {"_id": 0})
-    if not video:
-        raise HTTPException(status_code=404, detail="Video not found")
+    # Throttle and reject repeated submissions before any database access
+    fingerprint = comment_rate_limiter.check(current_user.id, video_id, comment_request.text)
     
-    # If this is a reply, verify parent comment exists
-    if comment_request.parent_comment_id:
-        parent_comment = await db.comments.find_one({"id": comment_request.parent_comment_id}, {"_id": 0})
-        if not parent_comment:
-            raise HTTPException(status_code=404, detail="Parent comment not found")
-        if parent_comment["video_id"] != video_id:
-            raise HTTPException(status_code=400, detail="Parent comment is not for this video")
+    try:
+        # Verify video exists
+        video = await db.videos.find_one({"id": video_id}, {"_id": 0, "id": 1})
+        if not video:
+            raise HTTPException(status_code=404, detail="Video not found")
+        
+        # If this is a reply, verify parent comment exists
+        parent_comment = None
+        if comment_request.parent_comment_id:
+            parent_comment = await db.comments.find_one(
+                {"id": comment_request.parent_comment_id, "deleted": {"$ne": True}},
+                {"_id": 0, "video_id": 1, "root_id": 1, "path": 1, "depth": 1}
+            )
+            if not parent_comment:
+                raise HTTPException(status_code=404, detail="Parent comment not found")
+            if parent_comment["video_id"] != video_id:
+                raise HTTPException(status_code=400, detail="Parent comment is not for this video")
+            if parent_comment["depth"] + 1 > COMMENT_MAX_DEPTH:
+                raise HTTPException(status_code=400, detail="Replies cannot be nested this deep")
+    except HTTPException:
+        comment_rate_limiter.forget(fingerprint)
+        raise
     
     # Create comment
+    comment_id = str(uuid.uuid4())
+    created_at = datetime.utcnow()
     comment_data = {
-        "id": str(uuid.uuid4()),
+        "id": comment_id,
         "video_id": video_id,
         "user_id": current_user.id,
         "user_name": current_user.name,
         "text": comment_request.text.strip(),
         "pinned": False,  # New comments are not pinned by default
         "parent_comment_id": comment_request.parent_comment_id,
+        **build_comment_path_fields(comment_id, created_at, parent_comment),
         "like_count": 0,
-        "created_at": datetime.utcnow()
+        "reply_count": 0,
+        "created_at": created_at
     }
     
     await db.comments.insert_one(comment_data)
     
+    # Keep the denormalized counts in step with the insert; every ancestor counts the new reply
+    await db.videos.update_one({"id": video_id}, {"$inc": {"comment_count": 1}})
+    if parent_comment:
+        await db.comments.update_many(
+            {"id": {"$in": get_comment_ancestor_ids(parent_comment["path"])}},
+            {"$inc": {"reply_count": 1}}
+        )
+    
+    comment_thread_cache.invalidate(video_id)
+    await publish_comment_event(video_id, "comment_created", {k: v for k, v in comment_data.items() if k != "_id"})
+    
     return {
         "message": "Comment created successfully",
         "comment": comment_data
@@ -980,14 +3905,38 @@ async def delete_comment(
     comment_id: str,
     current_user: User = Depends(require_role(UserRole.ADMIN))
 ):
-    """Delete a comment (admin only)"""
-    # Find and delete the comment
-    result = await db.comments.delete_one({"id": comment_id})
+    """Delete a comment together with its replies and likes (admin only)"""
+    comment = await db.comments.find_one(
+        {"id": comment_id, "deleted": {"$ne": True}},
+        {"_id": 0, "video_id": 1, "parent_comment_id": 1, "root_id": 1, "path": 1}
+    )
     
-    if result.deleted_count == 0:
+    if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    return {"message": "Comment deleted successfully"}
+    # Legacy replies saved before the path migration have no subtree to walk
+    if comment.get("path"):
+        subtree_filter = build_subtree_filter(comment)
+        ancestor_ids = get_comment_ancestor_ids(comment["path"])[:-1]
+    else:
+        subtree_filter = {"id": comment_id}
+        ancestor_ids = [comment["parent_comment_id"]] if comment.get("parent_comment_id") else []
+    
+    subtree_ids = await db.comments.distinct("id", {**subtree_filter, "deleted": {"$ne": True}})
+    removed_count = await remove_comments(subtree_ids)
+    
+    await db.videos.update_one({"id": comment["video_id"]}, {"$inc": {"comment_count": -removed_count}})
+    if ancestor_ids:
+        await db.comments.update_many({"id": {"$in": ancestor_ids}}, {"$inc": {"reply_count": -removed_count}})
+    
+    comment_thread_cache.invalidate(comment["video_id"])
+    await publish_comment_event(comment["video_id"], "comment_deleted", {
+        "id": comment_id,
+        "parent_comment_id": comment.get("parent_comment_id"),
+        "deleted_ids": subtree_ids
+    })
+    
+    return {"message": "Comment deleted successfully", "deleted_count": removed_count}
 
 @app.put("/api/comments/{comment_id}/pin")
 async def pin_comment(
@@ -996,16 +3945,19 @@ async def pin_comment(
 ):
     """Pin a comment (admin only)"""
     # Update comment to set pinned = True
-    result = await db.comments.update_one(
-        {"id": comment_id},
-        {"$set": {"pinned": True}}
+    comment = await db.comments.find_one_and_update(
+        {"id": comment_id, "deleted": {"$ne": True}},
+        {"$set": {"pinned": True}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    # Get the updated comment
-    comment = await db.comments.find_one({"id": comment_id}, {"_id": 0})
+    # Pinning reorders the thread, so cached pages are dropped rather than patched
+    comment_thread_cache.invalidate(comment["video_id"])
+    await publish_comment_event(comment["video_id"], "comment_pinned", {"id": comment_id, "pinned": comment["pinned"]})
     
     return {
         "message": "Comment pinned successfully",
@@ -1019,16 +3971,19 @@ async def unpin_comment(
 ):
     """Unpin a comment (admin only)"""
     # Update comment to set pinned = False
-    result = await db.comments.update_one(
-        {"id": comment_id},
-        {"$set": {"pinned": False}}
+    comment = await db.comments.find_one_and_update(
+        {"id": comment_id, "deleted": {"$ne": True}},
+        {"$set": {"pinned": False}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    # Get the updated comment
-    comment = await db.comments.find_one({"id": comment_id}, {"_id": 0})
+    # Pinning reorders the thread, so cached pages are dropped rather than patched
+    comment_thread_cache.invalidate(comment["video_id"])
+    await publish_comment_event(comment["video_id"], "comment_unpinned", {"id": comment_id, "pinned": comment["pinned"]})
     
     return {
         "message": "Comment unpinned successfully",
@@ -1042,20 +3997,11 @@ async def like_comment(
 ):
     """Like a comment (authenticated users only)"""
     # Check if comment exists
-    comment = await db.comments.find_one({"id": comment_id}, {"_id": 0})
+    comment = await db.comments.find_one({"id": comment_id, "deleted": {"$ne": True}}, {"_id": 0})
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    # Check if user already liked this comment
-    existing_like = await db.user_comment_likes.find_one({
-        "user_id": current_user.id,
-        "comment_id": comment_id
-    })
-    
-    if existing_like:
-        return {"message": "Comment already liked", "already_liked": True}
-    
-    # Add like
+    # The unique (user_id, comment_id) index makes the insert itself the "already liked" check
     like_data = {
         "id": str(uuid.uuid4()),
         "user_id": current_user.id,
@@ -1063,20 +4009,19 @@ async def like_comment(
         "created_at": datetime.utcnow()
     }
     
-    await db.user_comment_likes.insert_one(like_data)
-    
-    # Update comment like count
-    await db.comments.update_one(
-        {"id": comment_id},
-        {"$inc": {"like_count": 1}}
-    )
+    try:
+        await db.user_comment_likes.insert_one(like_data)
+    except DuplicateKeyError:
+        return {"message": "Comment already liked", "already_liked": True}
     
-    # Get updated comment
-    updated_comment = await db.comments.find_one({"id": comment_id}, {"_id": 0})
+    # The count is buffered and flushed in batches instead of hitting the comment on every like
+    like_counter_buffer.add(comment_id, comment["video_id"], 1)
+    like_counter_buffer.apply([comment])
+    await publish_comment_event(comment["video_id"], "like_count", {"id": comment_id, "like_count": comment["like_count"]})
     
     return {
         "message": "Comment liked successfully",
-        "comment": updated_comment,
+        "comment": comment,
         "already_liked": False
     }
 
@@ -1087,7 +4032,7 @@ async def unlike_comment(
 ):
     """Unlike a comment (authenticated users only)"""
     # Check if comment exists
-    comment = await db.comments.find_one({"id": comment_id}, {"_id": 0})
+    comment = await db.comments.find_one({"id": comment_id, "deleted": {"$ne": True}}, {"_id": 0})
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
@@ -1100,21 +4045,85 @@ async def unlike_comment(
     if result.deleted_count == 0:
         return {"message": "Comment was not liked", "was_liked": False}
     
-    # Update comment like count
-    await db.comments.update_one(
-        {"id": comment_id},
-        {"$inc": {"like_count": -1}}
-    )
-    
-    # Get updated comment
-    updated_comment = await db.comments.find_one({"id": comment_id}, {"_id": 0})
+    like_counter_buffer.add(comment_id, comment["video_id"], -1)
+    like_counter_buffer.apply([comment])
+    await publish_comment_event(comment["video_id"], "like_count", {"id": comment_id, "like_count": comment["like_count"]})
     
     return {
         "message": "Comment unliked successfully",
-        "comment": updated_comment,
+        "comment": comment,
         "was_liked": True
     }
 
+async def reconcile_comment_counts() -> dict:
+    """Recount comment_count on videos and reply_count on comments to repair drift"""
+    video_counts = await db.comments.aggregate([
+        {"$match": {"deleted": {"$ne": True}}},
+        {"$group": {"_id": "$video_id", "count": {"$sum": 1}}}
+    ], allowDiskUse=True).to_list(None)
+    # A reply counts towards every ancestor on its path
+    descendant_counts = {}
+    async for reply in db.comments.find({"depth": {"$gt": 0}, "deleted": {"$ne": True}}, {"_id": 0, "path": 1}):
+        for ancestor_id in get_comment_ancestor_ids(reply["path"])[:-1]:
+            descendant_counts[ancestor_id] = descendant_counts.get(ancestor_id, 0) + 1
+    reply_counts = [{"_id": ancestor_id, "count": count} for ancestor_id, count in descendant_counts.items()]
+    
+    for collection, key, field, counts in (
+        (db.videos, "id", "comment_count", video_counts),
+        (db.comments, "id", "reply_count", reply_counts)
+    ):
+        operations = [UpdateOne({key: group["_id"]}, {"$set": {field: group["count"]}}) for group in counts]
+        for start in range(0, len(operations), ROLLUP_BACKFILL_BATCH_SIZE):
+            await collection.bulk_write(operations[start:start + ROLLUP_BACKFILL_BATCH_SIZE], ordered=False)
+        await collection.update_many(
+            {key: {"$nin": [group["_id"] for group in counts]}, field: {"$ne": 0}},
+            {"$set": {field: 0}}
+        )
+    
+    return {"videos_counted": len(video_counts), "comments_with_replies": len(reply_counts)}
+
+@app.post("/api/admin/comments/reconcile-counts")
+async def reconcile_comment_counts_endpoint(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Repair denormalized comment and reply counts (admin only)"""
+    
+    result = await reconcile_comment_counts()
+    comment_thread_cache.clear()
+    
+    return {"message": "Comment counts reconciled", **result}
+
+@app.post("/api/admin/comments/migrate-paths")
+async def migrate_comment_paths_endpoint(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Convert comments without a materialized path (admin only)"""
+    
+    migrated = await migrate_comment_paths()
+    comment_thread_cache.clear()
+    
+    return {"message": "Comment paths migrated", "migrated": migrated}
+
+@app.post("/api/admin/comments/sweep-orphans")
+async def sweep_orphaned_comments_endpoint(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Remove orphaned replies and likes, then repair counts (admin only)"""
+    
+    result = await sweep_orphaned_comment_data()
+    result.update(await reconcile_comment_counts())
+    comment_thread_cache.clear()
+    
+    return {"message": "Orphaned comment data removed", **result}
+
+# =========== METRICS ===========
+
+@app.get("/api/admin/metrics")
+async def get_metrics(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Get in-process cache and limiter counters (admin only)"""
+    return {
+        "comment_thread_cache": comment_thread_cache.stats(),
+        "like_counter_buffer": like_counter_buffer.stats(),
+        "comment_rate_limiter": comment_rate_limiter.stats(),
+        "comment_events": comment_event_broker.stats(),
+        "media_jobs": media_job_queue.stats(),
+        "image_cache": image_disk_cache.stats()
+    }
+
 # =========== CONTENT MANAGEMENT ENDPOINTS ===========
 
 @app.get("/api/content/{section}")
@@ -1421,6 +4430,7 @@ async def init_sample_data():
                 "video_type": "youtube",
                 "video_url": None,
                 "youtube_video_id": "sample1",
+                "comment_count": 0,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             },
@@ -1440,6 +4450,7 @@ async def init_sample_data():
                 "video_type": "youtube",
                 "video_url": None,
                 "youtube_video_id": "sample2",
+                "comment_count": 0,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             },
@@ -1459,6 +4470,7 @@ async def init_sample_data():
                 "video_type": "youtube",
                 "video_url": None,
                 "youtube_video_id": "sample3",
+                "comment_count": 0,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             },
@@ -1478,6 +4490,7 @@ async def init_sample_data():
                 "video_type": "youtube",
                 "video_url": None,
                 "youtube_video_id": "sample4",
+                "comment_count": 0,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             },
@@ -1497,6 +4510,7 @@ async def init_sample_data():
                 "video_type": "youtube",
                 "video_url": None,
                 "youtube_video_id": "sample5",
+                "comment_count": 0,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             }
@@ -1511,10 +4525,82 @@ async def init_sample_data():
     except Exception as e:
         print(f"❌ Error initializing sample data: {e}")
 
+async def create_unique_like_index():
+    """Make (user_id, comment_id) unique, replacing the older non-unique index and duplicate likes"""
+    existing = (await db.user_comment_likes.index_information()).get("user_id_1_comment_id_1")
+    if existing and existing.get("unique"):
+        return
+    
+    # Remove duplicate likes left behind by the old check-then-insert race
+    duplicates = db.user_comment_likes.aggregate([
+        {"$group": {
+            "_id": {"user_id": "$user_id", "comment_id": "$comment_id"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    async for duplicate in duplicates:
+        await db.user_comment_likes.delete_many({"_id": {"$in": duplicate["ids"][1:]}})
+    
+    if existing:
+        await db.user_comment_likes.drop_index("user_id_1_comment_id_1")
+    
+    # Also covers the batched "did I like it" lookup without touching documents
+    await db.user_comment_likes.create_index([("user_id", 1), ("comment_id", 1)], unique=True)
+
+async def create_indexes():
+    """Create indexes backing the hot read and write paths"""
+    try:
+        await db.user_progress.create_index([("session_id", 1), ("video_id", 1)])
+        await db.user_progress.create_index([("user_id", 1)])
+        await db.daily_activity.create_index([("learner_id", 1), ("date", -1)], unique=True)
+        await db.learner_streaks.create_index([("learner_id", 1)], unique=True)
+        await db.learner_level_hours.create_index([("learner_id", 1)], unique=True)
+        await db.comments.create_index([("video_id", 1), ("parent_comment_id", 1), ("pinned", -1), ("created_at", -1), ("id", -1)])
+        await db.comments.create_index([("id", 1)], unique=True)
+        await db.comments.create_index([("root_id", 1), ("path", 1)])
+        await create_unique_like_index()
+        await db.comment_events.create_index([("created_at", 1)], expireAfterSeconds=COMMENT_EVENT_RETENTION_SECONDS)
+        await db.video_uploads.create_index([("id", 1)], unique=True)
+        await db.video_uploads.create_index([("expires_at", 1)])
+        await db.media_blobs.create_index([("sha256", 1)], unique=True)
+        await db.media_jobs.create_index([("id", 1)], unique=True)
+        await db.media_jobs.create_index([("status", 1), ("run_after", 1)])
+        await db.media_jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+        await db.media_jobs.create_index([("video_id", 1), ("created_at", -1)])
+    except Exception as e:
+        print(f"❌ Error creating indexes: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize sample data on startup"""
+    await create_indexes()
     await init_sample_data()
+    try:
+        migrated = await migrate_comment_paths()
+        if migrated:
+            print(f"✅ Migrated {migrated} comments to materialized paths")
+    except Exception as e:
+        print(f"❌ Error migrating comment paths: {e}")
+    like_counter_buffer.start()
+    comment_event_broker.start()
+    global comment_purge_task, upload_gc_task
+    if COMMENT_DELETE_MODE == "soft":
+        comment_purge_task = asyncio.create_task(run_comment_purge())
+    upload_gc_task = asyncio.create_task(run_upload_gc())
+    media_job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist buffered counters and stop background tasks before the process exits"""
+    comment_event_broker.stop()
+    if comment_purge_task is not None:
+        comment_purge_task.cancel()
+    if upload_gc_task is not None:
+        upload_gc_task.cancel()
+    await media_job_queue.stop()
+    await like_counter_buffer.stop()
 
 # Health check endpoint
 @app.get("/health")
@@ -0,0 +1,72 @@
+"""Time /files video streaming: whole-file GETs and random byte-range GETs, as a player seeks.
+
+Requests go through the ASGI app in-process, so the numbers cover the response path
+(chunked pread) without network or server overhead; servers that offer zero-copy send
+skip that path entirely.
+
+    python benchmarks/bench_media.py [--size-mb 256] [--runs 5] [--ranges 200] [--range-kb 1024]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+
+
+def write_video(directory: str, size: int) -> str:
+    os.makedirs(os.path.join(directory, "videos"))
+    name = f"videos/{'0' * 64}.mp4"
+    with open(os.path.join(directory, name), "wb") as video:
+        for offset in range(0, size, server.UPLOAD_CHUNK_SIZE):
+            video.write(os.urandom(min(server.UPLOAD_CHUNK_SIZE, size - offset)))
+    return f"/files/{name}"
+
+
+async def timed_get(client: httpx.AsyncClient, url: str, headers: dict) -> tuple:
+    started = time.perf_counter()
+    received = 0
+    async with client.stream("GET", url, headers=headers) as response:
+        async for chunk in response.aiter_raw():
+            received += len(chunk)
+    return time.perf_counter() - started, received
+
+
+async def run(size: int, runs: int, ranges: int, range_bytes: int):
+    with tempfile.TemporaryDirectory() as directory:
+        server.UPLOAD_DIR = directory
+        url = write_video(directory, size)
+        
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            whole = [await timed_get(client, url, {}) for _ in range(runs)]
+            seeks = []
+            for _ in range(ranges):
+                start = random.randrange(0, size - range_bytes)
+                seeks.append(await timed_get(client, url, {"Range": f"bytes={start}-{start + range_bytes - 1}"}))
+        
+        for label, results in (("whole file", whole), (f"{range_bytes // 1024} KiB ranges", seeks)):
+            seconds = sum(elapsed for elapsed, _ in results)
+            received = sum(count for _, count in results)
+            timings = sorted(elapsed for elapsed, _ in results)
+            print(
+                f"{label}: {len(results)} requests, {received / seconds / 1024 / 1024:.0f} MiB/s, "
+                f"median {timings[len(timings) // 2] * 1000:.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ranges", type=int, default=200)
+    parser.add_argument("--range-kb", type=int, default=1024)
+    args = parser.parse_args()
+    asyncio.run(run(args.size_mb * 1024 * 1024, args.runs, args.ranges, args.range_kb * 1024))
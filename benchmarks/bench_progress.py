@@ -0,0 +1,78 @@
+"""Time GET /api/progress/{session_id} for a learner with 10k progress records.
+
+Runs against an in-memory mongomock database by default. Pass --mongo to use the
+MongoDB at MONGO_URL instead (a throwaway english_fiesta_bench database is used);
+mongomock timings are only useful for comparing runs against each other.
+
+    python benchmarks/bench_progress.py [--records 10000] [--runs 20] [--mongo]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server  # noqa: E402
+
+
+def get_database(use_mongo: bool):
+    if use_mongo:
+        return server.client.english_fiesta_bench
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient().english_fiesta_bench
+
+
+async def seed(database, records: int, user: server.User):
+    now = datetime.utcnow()
+    await database.user_progress.insert_many([
+        {
+            "user_id": user.id,
+            "session_id": "bench-session",
+            "video_id": f"video-{index}",
+            "minutes_watched": index % 45,
+            "credited_minutes": index % 45,
+            "credited_days": {(now - timedelta(days=index % 60)).date().isoformat(): index % 45},
+            "completed": index % 3 == 0,
+            "last_watched_at": now - timedelta(days=index % 60)
+        }
+        for index in range(records)
+    ])
+    await server.backfill_daily_activity()
+
+
+async def run(records: int, runs: int, use_mongo: bool):
+    server.db = get_database(use_mongo)
+    await server.db.user_progress.drop()
+    await server.db.daily_activity.drop()
+    user = server.User(
+        id="bench-learner", name="Bench Learner", email="bench@example.com",
+        role=server.UserRole.STUDENT, created_at=datetime.utcnow()
+    )
+    
+    await seed(server.db, records, user)
+    
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        progress = await server.get_user_progress("bench-session", current_user=user)
+        timings.append(time.perf_counter() - started)
+    
+    timings.sort()
+    print(f"records: {records}, runs: {runs}, backend: {'mongodb' if use_mongo else 'mongomock'}")
+    print(f"unique videos: {progress['unique_videos_watched']}, total minutes: {progress['total_minutes_watched']}")
+    print(f"median: {timings[len(timings) // 2] * 1000:.1f} ms, max: {timings[-1] * 1000:.1f} ms")
+    
+    if use_mongo:
+        await server.client.drop_database("english_fiesta_bench")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--mongo", action="store_true", help="benchmark against MONGO_URL instead of mongomock")
+    args = parser.parse_args()
+    asyncio.run(run(args.records, args.runs, args.mongo))
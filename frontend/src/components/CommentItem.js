@@ -8,6 +8,8 @@ const CommentItem = ({ comment, onCommentDeleted, onCommentPinToggled, onComment
   const [isPinToggling, setIsPinToggling] = useState(false);
   const [isLiking, setIsLiking] = useState(false);
   const [showReplyForm, setShowReplyForm] = useState(false);
+  const [repliesCursor, setRepliesCursor] = useState(null);
+  const [isLoadingReplies, setIsLoadingReplies] = useState(false);
   const { user, isAuthenticated, sessionToken } = useAuth();
 
   const formatDate = (dateString) => {
@@ -113,11 +115,42 @@ const CommentItem = ({ comment, onCommentDeleted, onCommentPinToggled, onComment
     }
   };
 
+  const handleLoadMoreReplies = async () => {
+    setIsLoadingReplies(true);
+    try {
+      // The first page starts at the top of the thread, so it also covers the preview replies
+      const params = repliesCursor ? `?cursor=${encodeURIComponent(repliesCursor)}` : '';
+      const response = await fetch(
+        `${process.env.REACT_APP_BACKEND_URL}/api/comments/${comment.id}/replies${params}`,
+        {
+          headers: isAuthenticated ? { 'Authorization': `Bearer ${sessionToken}` } : {}
+        }
+      );
+
+      if (response.ok) {
+        const result = await response.json();
+        const shown = repliesCursor ? (comment.replies || []) : [];
+        onCommentUpdated({
+          ...comment,
+          replies: [...shown, ...result.replies.filter(reply => !shown.some(existing => existing.id === reply.id))]
+        });
+        setRepliesCursor(result.next_cursor);
+      } else {
+        console.error('Failed to load replies');
+      }
+    } catch (error) {
+      console.error('Error loading replies:', error);
+    } finally {
+      setIsLoadingReplies(false);
+    }
+  };
+
   const handleReplySubmitted = (newReply) => {
     // Add reply to this comment's replies
     const updatedComment = {
       ...comment,
-      replies: [...(comment.replies || []), newReply]
+      replies: [...(comment.replies || []), newReply],
+      reply_count: (comment.reply_count || 0) + 1
     };
     onCommentUpdated(updatedComment);
     setShowReplyForm(false);
@@ -126,6 +159,8 @@ const CommentItem = ({ comment, onCommentDeleted, onCommentPinToggled, onComment
   const canDelete = isAuthenticated && user?.role === 'admin';
   const canPin = isAuthenticated && user?.role === 'admin';
   const isTopLevel = level === 0;
+  // Threads arrive with only their first replies; reply_count covers the whole thread
+  const hiddenReplyCount = Math.max(0, (comment.reply_count || 0) - (comment.replies || []).length);
 
   return (
     <motion.div 
@@ -258,8 +293,8 @@ const CommentItem = ({ comment, onCommentDeleted, onCommentPinToggled, onComment
               >
                 <span>💬</span>
                 <span>Reply</span>
-                {comment.replies && comment.replies.length > 0 && (
-                  <span className="text-xs">({comment.replies.length})</span>
+                {comment.reply_count > 0 && (
+                  <span className="text-xs">({comment.reply_count})</span>
                 )}
               </motion.button>
             )}
@@ -299,6 +334,21 @@ const CommentItem = ({ comment, onCommentDeleted, onCommentPinToggled, onComment
               ))}
             </div>
           )}
+
+          {/* More Replies */}
+          {isTopLevel && hiddenReplyCount > 0 && (
+            <motion.button
+              onClick={handleLoadMoreReplies}
+              disabled={isLoadingReplies}
+              className="mt-3 pl-4 text-sm text-fiesta-blue hover:text-blue-700 font-poppins font-semibold transition-colors"
+              whileHover={{ scale: 1.02 }}
+              whileTap={{ scale: 0.98 }}
+            >
+              {isLoadingReplies
+                ? 'Loading replies...'
+                : `View ${hiddenReplyCount} more repl${hiddenReplyCount === 1 ? 'y' : 'ies'}`}
+            </motion.button>
+          )}
         </div>
       </div>
     </motion.div>
@@ -5,18 +5,34 @@ import CommentItem from './CommentItem';
 
 const CommentList = ({ videoId }) => {
   const [comments, setComments] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [hasMore, setHasMore] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
 
-  const fetchComments = async () => {
+  const fetchComments = async (cursor = null) => {
+    if (cursor) {
+      setLoadingMore(true);
+    }
     try {
+      const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
       const response = await fetch(
-        `${process.env.REACT_APP_BACKEND_URL}/api/comments/${videoId}`
+        `${process.env.REACT_APP_BACKEND_URL}/api/comments/${videoId}${params}`
       );
 
       if (response.ok) {
         const data = await response.json();
-        setComments(data.comments);
+        // Later pages are appended, skipping comments already shown after a new one was posted
+        setComments(prev => cursor
+          ? [...prev, ...data.comments.filter(comment => !prev.some(shown => shown.id === comment.id))]
+          : data.comments
+        );
+        setTotal(data.total);
+        setHasMore(data.has_more);
+        setNextCursor(data.next_cursor);
+        setError('');
       } else {
         setError('Failed to load comments');
       }
@@ -24,25 +40,51 @@ const CommentList = ({ videoId }) => {
       setError('Network error loading comments');
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
   useEffect(() => {
+    setLoading(true);
     fetchComments();
   }, [videoId]);
 
   const handleCommentSubmitted = (newComment) => {
     setComments(prev => [newComment, ...prev]);
+    setTotal(prev => prev + 1);
   };
 
   const handleCommentDeleted = (commentId) => {
-    setComments(prev => prev.filter(comment => comment.id !== commentId));
+    const deleted = comments.find(comment => comment.id === commentId);
+    if (deleted) {
+      // Deleting a comment removes its whole thread
+      setComments(prev => prev.filter(comment => comment.id !== commentId));
+      setTotal(prev => Math.max(0, prev - 1 - (deleted.reply_count || 0)));
+      return;
+    }
+
+    const parent = comments.find(comment => comment.replies && comment.replies.some(reply => reply.id === commentId));
+    if (!parent) {
+      return;
+    }
+    // Replies are listed flat in thread order, so the deleted reply's own replies share its path prefix
+    const deletedReply = parent.replies.find(reply => reply.id === commentId);
+    const removedCount = 1 + (deletedReply.reply_count || 0);
+    setComments(prev => prev.map(comment => comment.id !== parent.id ? comment : {
+      ...comment,
+      replies: comment.replies.filter(reply =>
+        reply.id !== commentId && !(deletedReply.path && reply.path && reply.path.startsWith(deletedReply.path))
+      ),
+      reply_count: Math.max(0, (comment.reply_count || 0) - removedCount)
+    }));
+    setTotal(prev => Math.max(0, prev - removedCount));
   };
 
   const handleCommentUpdated = (updatedComment) => {
     setComments(prev => prev.map(comment => {
       if (comment.id === updatedComment.id) {
-        return updatedComment;
+        // Like and pin responses do not carry the replies loaded so far
+        return { ...updatedComment, replies: updatedComment.replies || comment.replies };
       }
       // Check if this is a reply being updated
       if (comment.replies) {
@@ -116,7 +158,7 @@ const CommentList = ({ videoId }) => {
       >
         <p className="text-red-600 font-poppins">❌ {error}</p>
         <motion.button
-          onClick={fetchComments}
+          onClick={() => fetchComments()}
           className="mt-3 px-4 py-2 bg-red-600 text-white rounded-lg font-poppins hover:bg-red-700 transition-colors"
           whileHover={{ scale: 1.05 }}
           whileTap={{ scale: 0.95 }}
@@ -149,7 +191,7 @@ const CommentList = ({ videoId }) => {
           animate={{ scale: 1 }}
           transition={{ type: "spring", stiffness: 200, delay: 0.3 }}
         >
-          {comments.length} comment{comments.length !== 1 ? 's' : ''}
+          {total} comment{total !== 1 ? 's' : ''}
         </motion.div>
       </motion.div>
 
@@ -206,6 +248,21 @@ const CommentList = ({ videoId }) => {
         )}
       </AnimatePresence>
 
+      {/* Load More */}
+      {hasMore && (
+        <div className="flex justify-center">
+          <motion.button
+            onClick={() => fetchComments(nextCursor)}
+            disabled={loadingMore}
+            className="px-6 py-2 bg-fiesta-blue text-white rounded-lg font-poppins hover:bg-blue-700 transition-colors disabled:opacity-50"
+            whileHover={{ scale: 1.05 }}
+            whileTap={{ scale: 0.95 }}
+          >
+            {loadingMore ? 'Loading...' : 'Load more comments'}
+          </motion.button>
+        </div>
+      )}
+
       {/* Fun emoji decoration */}
       <motion.div 
         className="flex justify-center space-x-4 opacity-60"
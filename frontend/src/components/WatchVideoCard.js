@@ -16,6 +16,13 @@ const getSessionId = () => {
   return sessionId;
 };
 
+// Build a srcset string from the responsive thumbnail sizes recorded on the video
+const buildSrcSet = (thumbnails, key) =>
+  thumbnails.map((size) => `${BACKEND_URL}${size[key]} ${size.width}w`).join(', ');
+
+// Cards are full width on mobile and a third of the grid on desktop
+const THUMBNAIL_SIZES = '(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw';
+
 const WatchVideoCard = ({ video, onVideoSelect }) => {
   const { isAuthenticated, isStudent, sessionToken } = useAuth();
   const [showMarkModal, setShowMarkModal] = useState(false);
@@ -154,15 +161,23 @@ const WatchVideoCard = ({ video, onVideoSelect }) => {
     <div className="bg-white rounded-xl shadow-sm overflow-hidden hover:shadow-lg transition-all duration-300 cursor-pointer group">
       {/* Thumbnail */}
       <div className="relative" onClick={handlePlay}>
-        <img 
-          src={video.thumbnail_url ? `${BACKEND_URL}${video.thumbnail_url}` : 'data:image/svg+xml;charset=utf8,%3Csvg width="320" height="180" viewBox="0 0 320 180" xmlns="http://www.w3.org/2000/svg"%3E%3Crect width="320" height="180" fill="%23f8fafc"/%3E%3Cg transform="translate(160, 90)"%3E%3Ccircle r="24" fill="white" stroke="%23e5e7eb" stroke-width="2"/%3E%3Cpolygon points="-10,-14 -10,14 20,0" fill="%233b82f6"/%3E%3C/g%3E%3Ctext x="160" y="130" text-anchor="middle" fill="%23374151" font-family="Arial" font-size="14"%3EEnglish Fiesta%3C/text%3E%3C/svg%3E'}
-          alt={video.title}
-          className="w-full h-48 object-cover group-hover:scale-105 transition-transform duration-300"
-          onError={(e) => {
-            // Simple fallback with no complex encoding
-            e.target.src = 'data:image/svg+xml;charset=utf8,%3Csvg xmlns="http://www.w3.org/2000/svg" width="320" height="180" viewBox="0 0 320 180"%3E%3Crect width="320" height="180" fill="%23f3f4f6"/%3E%3Cg transform="translate(160, 90)"%3E%3Ccircle r="20" fill="%23e5e7eb"/%3E%3Cpolygon points="-8,-12 -8,12 16,0" fill="%236b7280"/%3E%3C/g%3E%3Ctext x="160" y="130" text-anchor="middle" fill="%23374151" font-family="Arial" font-size="12"%3EEnglish Fiesta%3C/text%3E%3C/svg%3E';
-          }}
-        />
+        <picture>
+          {video.thumbnails && video.thumbnails.length > 0 && (
+            <source type="image/webp" srcSet={buildSrcSet(video.thumbnails, 'webp_url')} sizes={THUMBNAIL_SIZES} />
+          )}
+          <img 
+            srcSet={video.thumbnails && video.thumbnails.length > 0 ? buildSrcSet(video.thumbnails, 'jpg_url') : undefined}
+            sizes={video.thumbnails && video.thumbnails.length > 0 ? THUMBNAIL_SIZES : undefined}
+            loading="lazy"
+            src={video.thumbnail_url ? `${BACKEND_URL}${video.thumbnail_url}` : 'data:image/svg+xml;charset=utf8,%3Csvg width="320" height="180" viewBox="0 0 320 180" xmlns="http://www.w3.org/2000/svg"%3E%3Crect width="320" height="180" fill="%23f8fafc"/%3E%3Cg transform="translate(160, 90)"%3E%3Ccircle r="24" fill="white" stroke="%23e5e7eb" stroke-width="2"/%3E%3Cpolygon points="-10,-14 -10,14 20,0" fill="%233b82f6"/%3E%3C/g%3E%3Ctext x="160" y="130" text-anchor="middle" fill="%23374151" font-family="Arial" font-size="14"%3EEnglish Fiesta%3C/text%3E%3C/svg%3E'}
+            alt={video.title}
+            className="w-full h-48 object-cover group-hover:scale-105 transition-transform duration-300"
+            onError={(e) => {
+              // Simple fallback with no complex encoding
+              e.target.src = 'data:image/svg+xml;charset=utf8,%3Csvg xmlns="http://www.w3.org/2000/svg" width="320" height="180" viewBox="0 0 320 180"%3E%3Crect width="320" height="180" fill="%23f3f4f6"/%3E%3Cg transform="translate(160, 90)"%3E%3Ccircle r="20" fill="%23e5e7eb"/%3E%3Cpolygon points="-8,-12 -8,12 16,0" fill="%236b7280"/%3E%3C/g%3E%3Ctext x="160" y="130" text-anchor="middle" fill="%23374151" font-family="Arial" font-size="12"%3EEnglish Fiesta%3C/text%3E%3C/svg%3E';
+            }}
+          />
+        </picture>
         
         {/* Play Button Overlay */}
         <div className="absolute inset-0 bg-black bg-opacity-0 group-hover:bg-opacity-30 transition-all duration-300 flex items-center justify-center">
@@ -0,0 +1,97 @@
+import os
+import sys
+from datetime import datetime
+
+import mongomock.aggregate
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server  # noqa: E402
+
+
+def handle_lookup_stage(in_collection, database, options, lookup=mongomock.aggregate._handle_lookup_stage):
+    """Run correlated $lookup sub-pipelines (MongoDB 5.0+), which mongomock does not implement"""
+    if "pipeline" not in options:
+        return lookup(in_collection, database, options)
+    foreign_collection = database.get_collection(options["from"])
+    for doc in in_collection:
+        matches = list(foreign_collection.find({options["foreignField"]: doc.get(options["localField"])}))
+        doc[options["as"]] = list(mongomock.aggregate.process_pipeline(matches, database, options["pipeline"], None))
+    return in_collection
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Point the server at a fresh in-memory database"""
+    monkeypatch.setitem(mongomock.aggregate._PIPELINE_HANDLERS, "$lookup", handle_lookup_stage)
+    database = AsyncMongoMockClient().english_fiesta_test
+    monkeypatch.setattr(server, "db", database)
+    server.video_metadata_cache.clear()
+    return database
+
+
+@pytest.fixture
+def media_dirs(tmp_path, monkeypatch):
+    """Point upload, media and resumable upload storage at a temp directory"""
+    directories = {
+        "UPLOAD_DIR": tmp_path,
+        "VIDEO_DIR": tmp_path / "videos",
+        "THUMBNAIL_DIR": tmp_path / "thumbnails",
+        "HLS_DIR": tmp_path / "hls",
+        "UPLOAD_TMP_DIR": tmp_path / "tmp",
+        "RESUMABLE_UPLOAD_DIR": tmp_path / "resumable"
+    }
+    for name, directory in directories.items():
+        directory.mkdir(exist_ok=True)
+        monkeypatch.setattr(server, name, str(directory))
+    return directories
+
+
+@pytest.fixture
+def as_admin(db):
+    """Authenticate every request to the app as an admin"""
+    admin = make_user("admin", role="admin")
+    server.app.dependency_overrides[server.get_current_user] = lambda: admin
+    yield admin
+    server.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def admin_client(as_admin):
+    return TestClient(server.app)
+
+
+def make_user(user_id: str = "learner-1", role: str = "student") -> server.User:
+    return server.User(
+        id=user_id,
+        name="Test Learner",
+        email=f"{user_id}@example.com",
+        role=server.UserRole(role),
+        created_at=datetime.utcnow()
+    )
+
+
+class CountingCollection:
+    """Records every method called on a collection"""
+    
+    def __init__(self, collection, calls: list):
+        self.collection = collection
+        self.calls = calls
+    
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if callable(attribute):
+            self.calls.append((self.collection.name, name))
+        return attribute
+
+
+class CountingDatabase:
+    def __init__(self, database):
+        self.database = database
+        self.calls = []
+    
+    def __getattr__(self, name):
+        return CountingCollection(getattr(self.database, name), self.calls)
@@ -0,0 +1,292 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from tests.conftest import CountingDatabase, make_user
+
+VIDEO_ID = "video-1"
+
+
+@pytest.fixture(autouse=True)
+def reset_comment_state():
+    server.comment_thread_cache.clear()
+    server.like_counter_buffer.pending = {}
+    yield
+    server.comment_thread_cache.clear()
+    server.like_counter_buffer.pending = {}
+
+
+async def seed_thread(db, comment_count: int, replies_per_comment: int = 2) -> list:
+    """Insert top-level comments, each with a few replies, and return every comment"""
+    await db.videos.insert_one({"id": VIDEO_ID, "title": "Ordering coffee", "comment_count": 0})
+    started = datetime(2026, 3, 1, 12)
+    comments = []
+    for index in range(comment_count):
+        created_at = started + timedelta(minutes=index)
+        root = {
+            "id": f"comment-{index}",
+            "video_id": VIDEO_ID,
+            "user_id": "author",
+            "content": f"Comment {index}",
+            "parent_comment_id": None,
+            "pinned": False,
+            "like_count": 0,
+            "reply_count": replies_per_comment,
+            "created_at": created_at,
+            **server.build_comment_path_fields(f"comment-{index}", created_at)
+        }
+        comments.append(root)
+        for reply_index in range(replies_per_comment):
+            reply_id = f"comment-{index}-reply-{reply_index}"
+            reply_created_at = created_at + timedelta(seconds=reply_index + 1)
+            comments.append({
+                "id": reply_id,
+                "video_id": VIDEO_ID,
+                "user_id": "author",
+                "content": f"Reply {reply_index}",
+                "parent_comment_id": root["id"],
+                "pinned": False,
+                "like_count": 0,
+                "reply_count": 0,
+                "created_at": reply_created_at,
+                **server.build_comment_path_fields(reply_id, reply_created_at, root)
+            })
+    await db.comments.insert_many([dict(comment) for comment in comments])
+    return comments
+
+
+def test_comment_page_query_count_does_not_grow_with_threads(db, monkeypatch):
+    viewer = make_user("viewer")
+    
+    async def load_page(comment_count: int):
+        await db.videos.drop()
+        await db.comments.drop()
+        await db.user_comment_likes.drop()
+        server.comment_thread_cache.clear()
+        comments = await seed_thread(db, comment_count)
+        liked = [comment["id"] for comment in comments[::4]]
+        await db.user_comment_likes.insert_many([{"user_id": viewer.id, "comment_id": comment_id} for comment_id in liked])
+        
+        counting = CountingDatabase(db)
+        monkeypatch.setattr(server, "db", counting)
+        page = await server.get_video_comments(VIDEO_ID, cursor=None, limit=20, current_user=viewer)
+        monkeypatch.setattr(server, "db", db)
+        return page, set(liked), counting.calls
+    
+    results = {comment_count: asyncio.run(load_page(comment_count)) for comment_count in (3, 15)}
+    
+    # A page costs the same handful of queries whether it holds 3 threads or 15
+    assert len(results[3][2]) == len(results[15][2])
+    for comment_count, (page, liked, calls) in results.items():
+        assert [call for call in calls if call[0] == "user_comment_likes"] == [("user_comment_likes", "find")]
+        rendered = page["comments"] + [reply for comment in page["comments"] for reply in comment["replies"]]
+        assert len(page["comments"]) == comment_count
+        assert {comment["id"] for comment in rendered if comment["user_liked"]} == liked & {comment["id"] for comment in rendered}
+
+
+def test_reply_previews_are_bounded_per_thread(db):
+    async def scenario():
+        await seed_thread(db, 2, replies_per_comment=7)
+        return await server.get_video_comments(VIDEO_ID, cursor=None, limit=20, current_user=None)
+    
+    page = asyncio.run(scenario())
+    
+    for comment in page["comments"]:
+        assert comment["reply_count"] == 7
+        assert [reply["id"] for reply in comment["replies"]] == [
+            f"{comment['id']}-reply-{index}" for index in range(server.COMMENT_REPLY_PREVIEW_SIZE)
+        ]
+
+
+def test_page_loaded_across_an_invalidation_is_not_cached(db, monkeypatch):
+    load_comment_page = server.load_comment_page
+    
+    async def load_while_a_comment_is_written(*args):
+        page = await load_comment_page(*args)
+        server.comment_thread_cache.invalidate(VIDEO_ID)
+        return page
+    
+    async def scenario():
+        await seed_thread(db, 2)
+        monkeypatch.setattr(server, "load_comment_page", load_while_a_comment_is_written)
+        await server.get_video_comments(VIDEO_ID, cursor=None, limit=20, current_user=None)
+        monkeypatch.setattr(server, "load_comment_page", load_comment_page)
+    
+    asyncio.run(scenario())
+    assert server.comment_thread_cache.get(VIDEO_ID, ":20") is None
+
+
+def test_page_loaded_across_a_like_flush_is_not_cached(db, monkeypatch):
+    load_comment_page = server.load_comment_page
+    
+    async def load_while_likes_are_flushed(*args):
+        page = await load_comment_page(*args)
+        await server.like_counter_buffer.flush()
+        return page
+    
+    async def scenario():
+        await seed_thread(db, 1, replies_per_comment=0)
+        server.like_counter_buffer.add("comment-0", VIDEO_ID, 1)
+        monkeypatch.setattr(server, "load_comment_page", load_while_likes_are_flushed)
+        await server.get_video_comments(VIDEO_ID, cursor=None, limit=20, current_user=None)
+        monkeypatch.setattr(server, "load_comment_page", load_comment_page)
+        return await server.get_video_comments(VIDEO_ID, cursor=None, limit=20, current_user=None)
+    
+    page = asyncio.run(scenario())
+    assert page["comments"][0]["like_count"] == 1
+
+
+def test_concurrent_likes_by_one_user_count_once(db):
+    viewer = make_user("viewer")
+    
+    async def scenario():
+        await seed_thread(db, 1, replies_per_comment=0)
+        await server.create_unique_like_index()
+        # A burst of double-clicks from the same viewer
+        results = await asyncio.gather(*(server.like_comment("comment-0", current_user=viewer) for _ in range(8)))
+        likes = await db.user_comment_likes.count_documents({"user_id": viewer.id, "comment_id": "comment-0"})
+        return results, likes
+    
+    results, likes = asyncio.run(scenario())
+    
+    assert likes == 1
+    assert sum(not result["already_liked"] for result in results) == 1
+    assert server.like_counter_buffer.pending_delta("comment-0") == 1
+
+
+def test_deleting_a_legacy_reply_without_a_path(db):
+    admin = make_user("admin", role="admin")
+    
+    async def scenario():
+        comments = await seed_thread(db, 1, replies_per_comment=1)
+        await db.videos.update_one({"id": VIDEO_ID}, {"$set": {"comment_count": len(comments)}})
+        # Replies written before the path migration carry only parent_comment_id
+        await db.comments.insert_one({
+            "id": "legacy-reply",
+            "video_id": VIDEO_ID,
+            "user_id": "author",
+            "text": "Legacy reply",
+            "parent_comment_id": "comment-0",
+            "pinned": False,
+            "like_count": 0,
+            "created_at": datetime(2026, 3, 1, 13)
+        })
+        await db.comments.update_one({"id": "comment-0"}, {"$inc": {"reply_count": 1}})
+        await db.videos.update_one({"id": VIDEO_ID}, {"$inc": {"comment_count": 1}})
+        
+        result = await server.delete_comment("legacy-reply", current_user=admin)
+        root = await db.comments.find_one({"id": "comment-0"})
+        video = await db.videos.find_one({"id": VIDEO_ID})
+        remaining = await db.comments.distinct("id")
+        return result, root, video, remaining
+    
+    result, root, video, remaining = asyncio.run(scenario())
+    assert result["deleted_count"] == 1
+    assert root["reply_count"] == 1
+    assert video["comment_count"] == 2
+    assert sorted(remaining) == ["comment-0", "comment-0-reply-0"]
+
+
+class FakeClock:
+    """Stands in for time.monotonic so rate limiter tests control the passage of time"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(server, "time", SimpleNamespace(monotonic=fake_clock))
+    return fake_clock
+
+
+def check_status(limiter: server.CommentRateLimiter, user_id: str, text: str) -> int:
+    try:
+        limiter.check(user_id, VIDEO_ID, text)
+    except HTTPException as error:
+        return error.status_code
+    return 200
+
+
+def test_rate_limiter_refills_tokens_over_time(clock):
+    limiter = server.CommentRateLimiter(per_minute=6, burst=2, duplicate_ttl_seconds=60)
+    
+    assert [check_status(limiter, "learner", f"Comment {index}") for index in range(3)] == [200, 200, 429]
+    # Six a minute is one token every ten seconds
+    clock.advance(9)
+    assert check_status(limiter, "learner", "Comment 3") == 429
+    clock.advance(1)
+    assert check_status(limiter, "learner", "Comment 4") == 200
+    assert check_status(limiter, "learner", "Comment 5") == 429
+    assert limiter.stats()["allowed"] == 3
+    assert limiter.stats()["rate_limited"] == 3
+
+
+def test_rate_limiter_retry_after_covers_the_missing_token(clock):
+    limiter = server.CommentRateLimiter(per_minute=6, burst=1, duplicate_ttl_seconds=60)
+    limiter.check("learner", VIDEO_ID, "First")
+    clock.advance(3.5)
+    
+    with pytest.raises(HTTPException) as error:
+        limiter.check("learner", VIDEO_ID, "Second")
+    
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "7"
+    clock.advance(7)
+    assert check_status(limiter, "learner", "Second") == 200
+
+
+def test_rate_limiter_rejects_duplicates_until_they_expire(clock):
+    limiter = server.CommentRateLimiter(per_minute=60, burst=5, duplicate_ttl_seconds=30)
+    limiter.check("learner", VIDEO_ID, "Great  video!")
+    
+    # Case and whitespace do not make a comment new
+    assert check_status(limiter, "learner", "great video!") == 409
+    assert check_status(limiter, "other-learner", "Great video!") == 200
+    clock.advance(29)
+    assert check_status(limiter, "learner", "Great video!") == 409
+    clock.advance(1)
+    assert check_status(limiter, "learner", "Great video!") == 200
+    assert limiter.stats()["duplicates"] == 2
+
+
+def test_rate_limiter_prunes_expired_fingerprints_and_idle_buckets(clock):
+    limiter = server.CommentRateLimiter(per_minute=6, burst=2, duplicate_ttl_seconds=30)
+    limiter.check("learner-1", VIDEO_ID, "Hello")
+    clock.advance(15)
+    limiter.check("learner-2", VIDEO_ID, "Hello")
+    assert limiter.stats()["tracked_users"] == 2
+    assert limiter.stats()["fingerprints"] == 2
+    
+    # Two tokens at one per ten seconds: learner-1's bucket is full again 20 seconds after
+    # its comment, and its fingerprint expires after 30
+    clock.advance(15)
+    limiter.check("learner-3", VIDEO_ID, "Hello")
+    assert set(limiter.buckets) == {"learner-2", "learner-3"}
+    assert limiter.stats()["fingerprints"] == 2
+    
+    clock.advance(5)
+    limiter.check("learner-3", VIDEO_ID, "Hello again")
+    assert set(limiter.buckets) == {"learner-3"}
+
+
+def test_rate_limiter_forget_allows_a_retry(clock):
+    limiter = server.CommentRateLimiter(per_minute=60, burst=5, duplicate_ttl_seconds=60)
+    fingerprint = limiter.check("learner", VIDEO_ID, "Saved?")
+    
+    assert check_status(limiter, "learner", "Saved?") == 409
+    limiter.forget(fingerprint)
+    assert check_status(limiter, "learner", "Saved?") == 200
+    # Forgetting an unknown fingerprint is harmless
+    limiter.forget("unknown")
@@ -0,0 +1,234 @@
+import asyncio
+import io
+import os
+import struct
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import server
+
+
+def test_image_cache_index_stays_consistent_under_concurrent_puts(tmp_path):
+    cache = server.ImageDiskCache(str(tmp_path), max_bytes=10_000)
+    
+    async def scenario():
+        await asyncio.gather(*(cache.put(f"image-{index}.webp", bytes(1_000 + index)) for index in range(40)))
+    
+    asyncio.run(scenario())
+    
+    assert cache.total_bytes == sum(cache.entries.values())
+    assert cache.total_bytes <= cache.max_bytes
+    assert sorted(os.listdir(tmp_path)) == sorted(cache.entries)
+    assert cache.evictions == 40 - len(cache.entries)
+
+
+def test_parse_byte_range():
+    size = 1000
+    assert server.parse_byte_range("bytes=100-199", size) == (100, 199)
+    assert server.parse_byte_range("bytes=900-", size) == (900, 999)
+    assert server.parse_byte_range("bytes=-10", size) == (990, 999)
+    assert server.parse_byte_range("bytes=990-5000", size) == (990, 999)
+    # Invalid or multi-range headers are ignored, so the whole file is sent
+    assert server.parse_byte_range("bytes=5-2", size) is None
+    assert server.parse_byte_range("bytes=0-1,5-6", size) is None
+    assert server.parse_byte_range("items=0-1", size) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0"])
+def test_parse_byte_range_rejects_ranges_past_the_end(header):
+    with pytest.raises(ValueError):
+        server.parse_byte_range(header, 1000)
+
+
+def write_thumbnail(path: str, width: int, height: int):
+    Image.new("RGB", (width, height), "orange").save(path, "JPEG")
+
+
+def test_regenerated_thumbnail_gets_new_cache_entries(db, media_dirs, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "image_disk_cache", server.ImageDiskCache(str(tmp_path / "image_cache"), max_bytes=10_000_000))
+    thumbnail_path = os.path.join(server.THUMBNAIL_DIR, "video-1.jpg")
+    write_thumbnail(thumbnail_path, 1280, 720)
+    asyncio.run(db.videos.insert_one({"id": "video-1", "thumbnail_url": "/files/thumbnails/video-1.jpg"}))
+    client = TestClient(server.app)
+    
+    first = client.get("/api/images/video-1", params={"w": 640, "fmt": "jpg"})
+    assert client.get(
+        "/api/images/video-1", params={"w": 640, "fmt": "jpg"}, headers={"If-None-Match": first.headers["etag"]}
+    ).status_code == 304
+    
+    # Thumbnail jobs rewrite the file under the same URL
+    write_thumbnail(thumbnail_path, 640, 640)
+    second = client.get("/api/images/video-1", params={"w": 640, "fmt": "jpg"})
+    
+    assert first.status_code == second.status_code == 200
+    assert second.headers["etag"] != first.headers["etag"]
+    assert Image.open(io.BytesIO(first.content)).size == (640, 360)
+    assert Image.open(io.BytesIO(second.content)).size == (640, 640)
+
+
+MEDIA_BYTES = os.urandom(5 * 1024 * 1024 + 123)
+
+
+@pytest.fixture
+def stored_video(media_dirs) -> str:
+    name = f"videos/{'a' * 64}.mp4"
+    with open(os.path.join(server.UPLOAD_DIR, name), "wb") as video:
+        video.write(MEDIA_BYTES)
+    return f"/files/{name}"
+
+
+def test_media_file_streams_whole_file(stored_video):
+    client = TestClient(server.app)
+    
+    response = client.get(stored_video)
+    
+    assert response.status_code == 200
+    assert response.content == MEDIA_BYTES
+    assert response.headers["content-length"] == str(len(MEDIA_BYTES))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get(stored_video, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+
+@pytest.mark.parametrize("header, start, end", [
+    # Spans several read chunks and ends mid-chunk
+    ("bytes=1048570-3145739", 1048570, 3145739),
+    ("bytes=4194304-", 4194304, len(MEDIA_BYTES) - 1),
+    ("bytes=-1000", len(MEDIA_BYTES) - 1000, len(MEDIA_BYTES) - 1),
+    ("bytes=0-0", 0, 0),
+])
+def test_media_file_streams_byte_ranges(stored_video, header, start, end):
+    response = TestClient(server.app).get(stored_video, headers={"Range": header})
+    
+    assert response.status_code == 206
+    assert response.content == MEDIA_BYTES[start:end + 1]
+    assert response.headers["content-length"] == str(end - start + 1)
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(MEDIA_BYTES)}"
+
+
+def test_media_file_range_edge_cases(stored_video):
+    client = TestClient(server.app)
+    etag = client.head(stored_video).headers["etag"]
+    
+    assert client.get(stored_video, headers={"Range": f"bytes={len(MEDIA_BYTES)}-"}).status_code == 416
+    # A stale If-Range validator gets the whole file instead of a range of a different one
+    stale = client.get(stored_video, headers={"Range": "bytes=0-99", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == MEDIA_BYTES
+    fresh = client.get(stored_video, headers={"Range": "bytes=0-99", "If-Range": etag})
+    assert fresh.status_code == 206
+    assert fresh.content == MEDIA_BYTES[:100]
+
+
+def test_media_file_hands_the_range_to_zero_copy_send(stored_video):
+    path = os.path.join(server.UPLOAD_DIR, stored_video[len("/files/"):])
+    response = server.MediaFileResponse(path, len(MEDIA_BYTES), (100, 2_000_099), {}, "video/mp4")
+    messages = []
+    
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            message = dict(message, file=message["file"].name)
+        messages.append(message)
+    
+    scope = {"type": "http", "method": "GET", "extensions": {"http.response.zerocopysend": {}}}
+    asyncio.run(response(scope, receive, send))
+    
+    assert messages[0]["status"] == 206
+    assert messages[1] == {
+        "type": "http.response.zerocopysend", "file": path, "offset": 100, "count": 2_000_000, "more_body": False
+    }
+
+
+def mp4_atom(kind: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+MOOV_AFTER = mp4_atom(b"ftyp", b"isom") + mp4_atom(b"mdat", b"\x00" * 64) + mp4_atom(b"moov", b"\x01" * 16)
+MOOV_BEFORE = mp4_atom(b"ftyp", b"isom") + mp4_atom(b"moov", b"\x01" * 16) + mp4_atom(b"mdat", b"\x00" * 64)
+
+
+@pytest.fixture
+def uploaded_video(db, media_dirs, monkeypatch):
+    """A local video record whose file the test writes; probing and ffmpeg are simulated"""
+    async def probe_media(path: str) -> dict:
+        return {"duration_ms": 90_000}
+    
+    async def run_media_command(args, timeout=None):
+        # ffmpeg -i <input> ... -movflags +faststart -y <output>
+        with open(args[-1], "wb") as output:
+            output.write(MOOV_BEFORE)
+        return 0, b"", b""
+    
+    monkeypatch.setattr(server, "probe_media", probe_media)
+    monkeypatch.setattr(server, "run_media_command", run_media_command)
+    monkeypatch.setattr(server, "HLS_RENDITION_HEIGHTS", [360])
+    asyncio.run(db.videos.insert_one({"id": "video-1", "video_type": "local", "video_url": "/files/videos/video-1.mp4"}))
+    return os.path.join(server.VIDEO_DIR, "video-1.mp4")
+
+
+def write_file(path: str, content: bytes):
+    with open(path, "wb") as file:
+        file.write(content)
+
+
+async def queued_jobs(db) -> list:
+    jobs = await db.media_jobs.find({}, {"_id": 0, "type": 1}).sort("created_at", 1).to_list(None)
+    return [job["type"] for job in jobs]
+
+
+async def run_queued(db, job_type: str) -> dict:
+    job = await db.media_jobs.find_one({"type": job_type}, {"_id": 0})
+    return await server.media_job_handlers[job_type]["run"](job)
+
+
+def test_upload_with_moov_at_the_end_derives_media_after_the_remux(db, uploaded_video):
+    write_file(uploaded_video, MOOV_AFTER)
+    
+    async def scenario():
+        await server.process_uploaded_video({"video_id": "video-1"})
+        before_remux = await queued_jobs(db)
+        await run_queued(db, "faststart_remux")
+        return before_remux, await queued_jobs(db)
+    
+    before_remux, after_remux = asyncio.run(scenario())
+    
+    assert before_remux == ["faststart_remux"]
+    assert after_remux == ["faststart_remux", "generate_thumbnails", "package_hls"]
+    with open(uploaded_video, "rb") as remuxed:
+        assert remuxed.read() == MOOV_BEFORE
+
+
+def test_upload_with_moov_at_the_front_derives_media_right_away(db, uploaded_video):
+    write_file(uploaded_video, MOOV_BEFORE)
+    
+    asyncio.run(server.process_uploaded_video({"video_id": "video-1"}))
+    
+    assert asyncio.run(queued_jobs(db)) == ["generate_thumbnails", "package_hls"]
+
+
+def test_failed_remux_still_derives_media_from_the_original(db, uploaded_video):
+    write_file(uploaded_video, MOOV_AFTER)
+    
+    async def scenario():
+        await server.process_uploaded_video({"video_id": "video-1"})
+        job = await db.media_jobs.find_one({"type": "faststart_remux"}, {"_id": 0})
+        await server.media_job_handlers["faststart_remux"]["on_failure"](job, "ffmpeg exited with 1")
+        return await queued_jobs(db)
+    
+    assert asyncio.run(scenario()) == ["faststart_remux", "generate_thumbnails", "package_hls"]
+
+
+def test_backfill_remux_does_not_rebuild_derived_media(db, uploaded_video):
+    write_file(uploaded_video, MOOV_AFTER)
+    
+    async def scenario():
+        await server.media_job_queue.enqueue("faststart_remux", "video-1")
+        await run_queued(db, "faststart_remux")
+        return await queued_jobs(db)
+    
+    assert asyncio.run(scenario()) == ["faststart_remux"]
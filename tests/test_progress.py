@@ -0,0 +1,211 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from tests.conftest import CountingDatabase, make_user
+
+VIDEO = {
+    "id": "video-1",
+    "title": "Ordering coffee",
+    "duration_minutes": 40,
+    "level": "Beginner",
+    "accents": ["American"],
+    "topics": ["Food"]
+}
+
+
+def frozen_datetime(moment: datetime):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return moment
+    return FrozenDatetime
+
+
+async def watch(minutes: int, user: server.User):
+    await server.track_video_watch(
+        VIDEO["id"], server.WatchRequest(watched_minutes=minutes), session_id="session-1", current_user=user
+    )
+
+
+async def get_rollups(db, learner_id: str) -> dict:
+    rollups = await db.daily_activity.find({"learner_id": learner_id}, {"_id": 0}).to_list(None)
+    return {rollup["date"]: rollup for rollup in rollups}
+
+
+def test_rewatch_does_not_subtract_minutes(db):
+    user = make_user()
+    
+    async def scenario():
+        await db.videos.insert_one(dict(VIDEO))
+        await watch(30, user)
+        # Rewatching from the start reports an earlier position
+        await watch(1, user)
+        await watch(20, user)
+        return await get_rollups(db, user.id)
+    
+    rollups = asyncio.run(scenario())
+    today = datetime.utcnow().date().isoformat()
+    assert rollups[today]["minutes"] == 30
+    assert rollups[today]["video_ids"] == [VIDEO["id"]]
+
+
+def test_rewatch_past_the_furthest_point_credits_only_new_minutes(db):
+    user = make_user()
+    
+    async def scenario():
+        await db.videos.insert_one(dict(VIDEO))
+        await watch(30, user)
+        await watch(5, user)
+        await watch(35, user)
+        return await get_rollups(db, user.id)
+    
+    rollups = asyncio.run(scenario())
+    assert rollups[datetime.utcnow().date().isoformat()]["minutes"] == 35
+
+
+def test_rewatch_heartbeat_makes_two_round_trips(db, monkeypatch):
+    user = make_user()
+    
+    async def scenario():
+        await db.videos.insert_one(dict(VIDEO))
+        await watch(30, user)
+        await watch(5, user)
+        counting = CountingDatabase(db)
+        monkeypatch.setattr(server, "db", counting)
+        await watch(6, user)
+        return counting.calls
+    
+    calls = asyncio.run(scenario())
+    assert calls == [("user_progress", "find_one_and_update"), ("daily_activity", "find_one_and_update")]
+
+
+def test_unmark_reverses_credits_on_every_day(db, monkeypatch):
+    user = make_user()
+    
+    async def scenario():
+        await db.videos.insert_one(dict(VIDEO))
+        monkeypatch.setattr(server, "datetime", frozen_datetime(datetime(2026, 3, 1, 12)))
+        await watch(10, user)
+        monkeypatch.setattr(server, "datetime", frozen_datetime(datetime(2026, 3, 2, 12)))
+        await watch(25, user)
+        monkeypatch.setattr(server, "datetime", datetime)
+        
+        before = await get_rollups(db, user.id)
+        await server.unmark_video_watched(
+            server.VideoListRequest(video_id=VIDEO["id"]), session_id="session-1", current_user=user
+        )
+        return before, await get_rollups(db, user.id)
+    
+    before, after = asyncio.run(scenario())
+    assert before["2026-03-01"]["minutes"] == 10
+    assert before["2026-03-02"]["minutes"] == 15
+    for date in ("2026-03-01", "2026-03-02"):
+        assert after[date]["minutes"] == 0
+        assert after[date]["video_ids"] == []
+
+
+async def get_level_counters(db, learner_id: str) -> dict:
+    return await db.learner_level_hours.find_one({"learner_id": learner_id}, {"_id": 0}) or {}
+
+
+def test_rewatch_keeps_level_counters(db):
+    user = make_user()
+    
+    async def scenario():
+        await db.videos.insert_one(dict(VIDEO))
+        await watch(30, user)
+        await watch(1, user)
+        return await get_level_counters(db, user.id)
+    
+    counters = asyncio.run(scenario())
+    assert counters["video_minutes"] == 30
+    assert counters["level_minutes"]["Beginner"] == 30
+    assert counters["accent_minutes"]["American"] == 30
+    assert counters["topic_minutes"]["Food"] == 30
+
+
+def test_unmark_removes_credited_level_minutes(db):
+    user = make_user()
+    
+    async def scenario():
+        await db.videos.insert_one(dict(VIDEO))
+        await watch(30, user)
+        await watch(10, user)
+        await server.unmark_video_watched(
+            server.VideoListRequest(video_id=VIDEO["id"]), session_id="session-1", current_user=user
+        )
+        return await get_level_counters(db, user.id)
+    
+    counters = asyncio.run(scenario())
+    assert counters["video_minutes"] == 0
+    assert counters["level_minutes"]["Beginner"] == 0
+
+
+def test_manual_activity_rejects_future_dates(db):
+    user = make_user()
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).date().isoformat()
+    
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.add_manual_activity(
+            server.ManualActivityRequest(date=tomorrow, minutes=20), current_user=user
+        ))
+    
+    assert error.value.status_code == 400
+    assert asyncio.run(db.manual_activities.count_documents({})) == 0
+    assert asyncio.run(db.learner_streaks.count_documents({})) == 0
+
+
+def test_manual_activity_accepts_today(db):
+    user = make_user()
+    today = datetime.utcnow().date().isoformat()
+    
+    asyncio.run(server.add_manual_activity(server.ManualActivityRequest(date=today, minutes=20), current_user=user))
+    
+    streak = asyncio.run(db.learner_streaks.find_one({"learner_id": user.id}))
+    assert streak["last_active_date"] == today
+
+
+def test_user_progress_reports_totals_and_recent_activity(db):
+    user = make_user()
+    
+    async def scenario():
+        await db.videos.insert_many([dict(VIDEO), dict(VIDEO, id="video-2", duration_minutes=12)])
+        await watch(30, user)
+        await watch(5, user)
+        await server.mark_video_watched("video-2", session_id="session-1", current_user=user)
+        return await server.get_user_progress("session-1", current_user=user)
+    
+    progress = asyncio.run(scenario())
+    today = datetime.utcnow().date().isoformat()
+    assert progress["total_minutes_watched"] == 42
+    assert progress["unique_videos_watched"] == 2
+    assert progress["completed_videos"] == 1
+    assert progress["today_minutes"] == 42
+    assert progress["current_streak"] == 1
+    assert progress["recent_activity"] == [
+        {"date": today, "minutes": 42, "manual_minutes": 0, "videos_count": 2}
+    ]
+
+
+def test_user_progress_without_history_is_empty(db):
+    progress = asyncio.run(server.get_user_progress("session-1", current_user=None))
+    assert progress["total_minutes_watched"] == 0
+    assert progress["unique_videos_watched"] == 0
+    assert progress["recent_activity"] == []
+
+
+@pytest.mark.parametrize("total_hours, current_level, next_level, hours_to_next_level", [
+    (0, "New Beginner", "Beginner", 25),
+    (150, "Intermediate", "Advanced", 50),
+    (320.5, "Advanced", "Master", 179.5),
+    (640, "Master", None, None),
+])
+def test_level_for_hours(total_hours, current_level, next_level, hours_to_next_level):
+    level = server.get_level_for_hours(total_hours)
+    assert level["current_level"] == current_level
+    assert level["next_level"] == next_level
+    assert level["hours_to_next_level"] == hours_to_next_level
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import os
+
+import httpx
+import pytest
+import starlette.formparsers
+
+import server
+
+VIDEO_BYTES = b"\x00\x00\x00\x18ftypmp42" + os.urandom(3 * 1024 * 1024)
+UPLOAD_FORM = {
+    "title": "Ordering coffee",
+    "description": "At the counter",
+    "level": "Beginner",
+    "accents": '["American"]',
+    "tags": '["cafe"]',
+    "instructor_name": "Sam",
+    "country": "USA",
+    "topics": '["Food"]',
+    "is_premium": "true"
+}
+
+
+@pytest.fixture
+def no_form_spool(monkeypatch):
+    """Fail the request if Starlette's form parser spools a file part"""
+    def spool(*args, **kwargs):
+        raise AssertionError("upload was spooled through the system temp dir")
+    monkeypatch.setattr(starlette.formparsers, "SpooledTemporaryFile", spool)
+
+
+def post_upload(client, form: dict = UPLOAD_FORM, content: bytes = VIDEO_BYTES, content_type: str = "video/mp4"):
+    return client.post(
+        "/api/admin/videos/upload",
+        data=form,
+        files={"video_file": ("coffee.mp4", content, content_type)}
+    )
+
+
+def test_upload_streams_straight_into_storage(admin_client, media_dirs, no_form_spool, db):
+    response = post_upload(admin_client)
+    
+    assert response.status_code == 200
+    video = response.json()["video"]
+    sha256 = hashlib.sha256(VIDEO_BYTES).hexdigest()
+    assert video["sha256"] == sha256
+    assert video["file_size"] == len(VIDEO_BYTES)
+    assert video["level"] == "Beginner"
+    assert video["topics"] == ["Food"]
+    assert video["is_premium"] is True
+    with open(os.path.join(server.VIDEO_DIR, f"{sha256}.mp4"), "rb") as stored:
+        assert stored.read() == VIDEO_BYTES
+    assert os.listdir(server.UPLOAD_TMP_DIR) == []
+
+
+@pytest.mark.parametrize("form, content_type, status_code", [
+    ({key: value for key, value in UPLOAD_FORM.items() if key != "title"}, "video/mp4", 422),
+    (dict(UPLOAD_FORM, level="Expert"), "video/mp4", 422),
+    (dict(UPLOAD_FORM, tags="not json"), "video/mp4", 400),
+    (UPLOAD_FORM, "image/png", 400),
+])
+def test_rejected_upload_leaves_no_temp_file(admin_client, media_dirs, db, form, content_type, status_code):
+    response = post_upload(admin_client, form=form, content_type=content_type)
+    
+    assert response.status_code == status_code
+    assert os.listdir(server.UPLOAD_TMP_DIR) == []
+    assert os.listdir(server.VIDEO_DIR) == []
+
+
+def test_oversized_upload_is_cut_off(admin_client, media_dirs, db, monkeypatch):
+    monkeypatch.setattr(server, "MAX_VIDEO_UPLOAD_BYTES", 1024 * 1024)
+    
+    response = post_upload(admin_client)
+    
+    assert response.status_code == 413
+    assert os.listdir(server.UPLOAD_TMP_DIR) == []
+
+
+MB = 1024 * 1024
+RESUMABLE_BYTES = os.urandom(3 * MB)
+
+
+def test_merge_byte_ranges():
+    assert server.merge_byte_ranges([]) == []
+    assert server.merge_byte_ranges([[20, 30], [0, 10], [5, 12]]) == [[0, 12], [20, 30]]
+    # Touching ranges leave no gap between them
+    assert server.merge_byte_ranges([[10, 20], [0, 10]]) == [[0, 20]]
+    assert server.merge_byte_ranges([[0, 100], [10, 20]]) == [[0, 100]]
+
+
+def test_describe_upload_lists_missing_ranges():
+    upload = {
+        "id": "upload-1", "status": "uploading", "filename": "coffee.mp4", "total_size": 100,
+        "received_ranges": [[60, 80], [10, 30], [20, 40]], "expires_at": None
+    }
+    
+    progress = server.describe_upload(upload)
+    
+    assert progress["received_bytes"] == 50
+    assert progress["missing_ranges"] == [[0, 10], [40, 60], [80, 100]]
+
+
+async def start_upload(client: httpx.AsyncClient) -> str:
+    response = await client.post("/api/admin/uploads", json={
+        "filename": "coffee.mp4",
+        "content_type": "video/mp4",
+        "total_size": len(RESUMABLE_BYTES),
+        **{key: value for key, value in UPLOAD_FORM.items() if key not in ("accents", "tags", "topics", "is_premium")}
+    })
+    assert response.status_code == 200
+    return response.json()["upload"]["id"]
+
+
+async def send_range(client: httpx.AsyncClient, upload_id: str, start: int, end: int) -> httpx.Response:
+    return await client.patch(f"/api/admin/uploads/{upload_id}", params={"offset": start}, content=RESUMABLE_BYTES[start:end])
+
+
+def run_with_client(scenario):
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await scenario(client)
+    return asyncio.run(run())
+
+
+def test_parallel_overlapping_chunks_assemble_the_file(as_admin, media_dirs, db):
+    async def scenario(client):
+        upload_id = await start_upload(client)
+        # Out of order, concurrent and overlapping, as a client retrying after a timeout would send them
+        responses = await asyncio.gather(
+            send_range(client, upload_id, 2 * MB, 3 * MB),
+            send_range(client, upload_id, 0, MB + MB // 2),
+            send_range(client, upload_id, MB, 2 * MB + MB // 2)
+        )
+        status = await client.get(f"/api/admin/uploads/{upload_id}")
+        finalized = await client.post(f"/api/admin/uploads/{upload_id}/finalize")
+        return responses, status.json()["upload"], finalized
+    
+    responses, progress, finalized = run_with_client(scenario)
+    
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert progress["received_bytes"] == len(RESUMABLE_BYTES)
+    assert progress["missing_ranges"] == []
+    assert finalized.status_code == 200
+    video = finalized.json()["video"]
+    assert video["sha256"] == hashlib.sha256(RESUMABLE_BYTES).hexdigest()
+    with open(os.path.join(server.VIDEO_DIR, f"{video['sha256']}.mp4"), "rb") as stored:
+        assert stored.read() == RESUMABLE_BYTES
+    assert os.listdir(server.RESUMABLE_UPLOAD_DIR) == []
+
+
+def test_finalize_refuses_an_upload_with_missing_ranges(as_admin, media_dirs, db):
+    async def scenario(client):
+        upload_id = await start_upload(client)
+        await send_range(client, upload_id, 0, MB)
+        await send_range(client, upload_id, 2 * MB, 3 * MB)
+        incomplete = await client.post(f"/api/admin/uploads/{upload_id}/finalize")
+        await send_range(client, upload_id, MB, 2 * MB)
+        completed = await client.post(f"/api/admin/uploads/{upload_id}/finalize")
+        return incomplete, completed
+    
+    incomplete, completed = run_with_client(scenario)
+    
+    assert incomplete.status_code == 409
+    assert incomplete.json()["detail"]["missing_ranges"] == [[MB, 2 * MB]]
+    assert completed.status_code == 200
+
+
+def test_second_finalize_returns_the_same_video(as_admin, media_dirs, db):
+    async def scenario(client):
+        upload_id = await start_upload(client)
+        await send_range(client, upload_id, 0, len(RESUMABLE_BYTES))
+        first = await client.post(f"/api/admin/uploads/{upload_id}/finalize")
+        second = await client.post(f"/api/admin/uploads/{upload_id}/finalize")
+        late_chunk = await send_range(client, upload_id, 0, MB)
+        return first, second, late_chunk
+    
+    first, second, late_chunk = run_with_client(scenario)
+    
+    assert first.status_code == second.status_code == 200
+    assert second.json()["video"]["id"] == first.json()["video"]["id"]
+    assert late_chunk.status_code == 409
+    assert asyncio.run(db.videos.count_documents({})) == 1
+    blob = asyncio.run(db.media_blobs.find_one({}))
+    assert blob["refcount"] == 1
+
+
+def test_shared_blob_is_removed_with_its_last_video(admin_client, media_dirs, db):
+    first = post_upload(admin_client).json()
+    second = post_upload(admin_client).json()
+    sha256 = first["video"]["sha256"]
+    blob_path = os.path.join(server.VIDEO_DIR, f"{sha256}.mp4")
+    # Thumbnails and HLS packages are kept per blob, next to the file they came from
+    derived_dirs = [os.path.join(server.THUMBNAIL_DIR, sha256), os.path.join(server.HLS_DIR, sha256)]
+    for directory in derived_dirs:
+        os.makedirs(directory)
+        open(os.path.join(directory, "derived"), "wb").close()
+    
+    assert second["video"]["blob_id"] == sha256
+    assert second["job"] is None
+    assert asyncio.run(db.media_blobs.find_one({"sha256": sha256}))["refcount"] == 2
+    assert os.listdir(server.VIDEO_DIR) == [f"{sha256}.mp4"]
+    
+    response = admin_client.delete(f"/api/admin/videos/{first['video']['id']}")
+    assert response.json()["file_deleted"] is False
+    assert asyncio.run(db.media_blobs.find_one({"sha256": sha256}))["refcount"] == 1
+    assert os.path.exists(blob_path)
+    assert all(os.path.isdir(directory) for directory in derived_dirs)
+    
+    response = admin_client.delete(f"/api/admin/videos/{second['video']['id']}")
+    assert response.json()["file_deleted"] is True
+    assert asyncio.run(db.media_blobs.count_documents({})) == 0
+    assert not os.path.exists(blob_path)
+    assert not any(os.path.exists(directory) for directory in derived_dirs)